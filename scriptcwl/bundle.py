@@ -0,0 +1,114 @@
+"""Bundles of pre-validated steps.
+
+A bundle is a zip file containing CWL files and an index (``index.json``)
+with the name, python name, signature and hash of every step, and the result
+of validating it. The CWL files are stored without directories, so
+(sub)workflows should refer to steps in the same directory (as in a working
+directory).
+"""
+import os
+import json
+import shutil
+import tempfile
+import zipfile
+
+from .cache import file_hash
+from .step import step_name, python_name
+
+BUNDLE_INDEX = 'index.json'
+BUNDLE_FORMAT = 1
+
+
+def create_bundle(fname, steps_dir=None, step_file=None, step_list=None,
+                  workers=None):
+    """Validate steps and save them to a bundle.
+
+    The steps are validated in a temporary working directory, so workflows
+    are validated in the same way they will be used from the bundle.
+
+    Args:
+        fname (str): the bundle file to create.
+        steps_dir (str, optional): path to directory containing CWL files.
+        step_file (str, optional): path to a single CWL file.
+        step_list (list, optional): a list of directories or local file paths
+            to CWL files or directories containing CWL files.
+        workers (int, optional): number of processes used to validate the
+            CWL files.
+
+    Returns:
+        dict: the index of the bundle.
+    """
+    from .library import find_step_files, stage_step_files, create_steps
+
+    step_files = find_step_files(steps_dir=steps_dir, step_file=step_file,
+                                 step_list=step_list)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        step_files = stage_step_files(step_files, tmp_dir)
+        results = create_steps(step_files, workers=workers)
+
+        index = {'format': BUNDLE_FORMAT, 'steps': []}
+        with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for f, (step, error) in zip(step_files, results):
+                arcname = os.path.basename(f)
+                entry = {'name': step_name(f),
+                         'python_name': python_name(step_name(f)),
+                         'file': arcname,
+                         'sha256': file_hash(f)}
+                if step is None:
+                    entry['error'] = error
+                else:
+                    entry['signature'] = str(step)
+                    entry['is_workflow'] = step.is_workflow
+                index['steps'].append(entry)
+                bundle.write(f, arcname)
+            bundle.writestr(BUNDLE_INDEX, json.dumps(index, indent=2))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return index
+
+
+def read_bundle_index(fname):
+    """Return the index of a bundle, without extracting the CWL files.
+
+    Raises:
+        ValueError: The file is not a bundle created with a supported
+            version of scriptcwl.
+    """
+    with zipfile.ZipFile(fname) as bundle:
+        try:
+            index = json.loads(bundle.read(BUNDLE_INDEX).decode('utf-8'))
+        except KeyError:
+            raise ValueError('"{}" is not a steps bundle.'.format(fname))
+    if index.get('format') != BUNDLE_FORMAT:
+        msg = 'Unsupported format of steps bundle "{}".'.format(fname)
+        raise ValueError(msg)
+    return index
+
+
+def extract_steps(fname, entries, target_dir):
+    """Extract CWL files from a bundle.
+
+    Files that were already extracted to the target directory are not
+    extracted again.
+
+    Args:
+        fname (str): the bundle file.
+        entries (list): index entries of the steps to extract.
+        target_dir (str): the directory to extract the CWL files to.
+
+    Raises:
+        ValueError: The hash of an extracted file does not match the index.
+    """
+    with zipfile.ZipFile(fname) as bundle:
+        for entry in entries:
+            target = os.path.join(target_dir, entry['file'])
+            if os.path.isfile(target) and \
+                    file_hash(target) == entry['sha256']:
+                continue
+            with open(target, 'wb') as f:
+                f.write(bundle.read(entry['file']))
+            if file_hash(target) != entry['sha256']:
+                msg = 'Step "{}" in bundle "{}" is corrupt.'
+                raise ValueError(msg.format(entry['name'], fname))
@@ -0,0 +1,242 @@
+"""Persistent cache of validated steps.
+"""
+import os
+import hashlib
+import json
+import logging
+import pickle
+
+import six
+from ruamel import yaml
+
+from .remote import HTTPCache
+from .scriptcwl import is_url
+
+logger = logging.getLogger(__name__)
+
+# Increase when the representation of Step changes, to make sure old cache
+# entries are not used anymore.
+CACHE_FORMAT = 5
+
+
+def cwltool_version():
+    """Return the version of the installed cwltool."""
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import get_distribution
+
+        return get_distribution('cwltool').version
+    return version('cwltool')
+
+
+def file_hash(fname):
+    """Return the sha256 hash of the contents of a file."""
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def document_hash(obj):
+    """Return the sha256 hash of a (parsed) CWL document."""
+    text = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def run_targets(fname):
+    """Return the local files the steps of a workflow run.
+
+    Subworkflows are followed, so the files run by their steps are included
+    as well. Urls are skipped.
+
+    Args:
+        fname (str): path of a CWL file.
+
+    Returns:
+        list: the sorted absolute paths of the files, or an empty list if
+        the CWL file is not a workflow.
+    """
+    targets = set()
+    todo = [os.path.abspath(fname)]
+    while todo:
+        f = todo.pop()
+        for target in _step_runs(f):
+            if target not in targets:
+                targets.add(target)
+                todo.append(target)
+    return sorted(targets)
+
+
+def _step_runs(fname):
+    """Return the local files run by the steps of a workflow file."""
+    try:
+        with open(fname, 'rb') as f:
+            text = f.read()
+        if b'Workflow' not in text:
+            # not a workflow, so the file does not need to be parsed
+            return []
+        obj = yaml.YAML(typ='safe').load(text)
+    except (IOError, OSError, yaml.YAMLError):
+        return []
+
+    runs = []
+    processes = [obj]
+    while processes:
+        process = processes.pop()
+        if not isinstance(process, dict) or \
+                process.get('class') != 'Workflow':
+            continue
+        steps = process.get('steps', [])
+        if isinstance(steps, dict):
+            steps = steps.values()
+        for step in steps:
+            run = step.get('run') if isinstance(step, dict) else None
+            if isinstance(run, dict):
+                # inline process
+                processes.append(run)
+            elif isinstance(run, six.string_types) and not is_url(run) \
+                    and not run.startswith('#'):
+                runs.append(os.path.normpath(
+                    os.path.join(os.path.dirname(fname), run)))
+    return runs
+
+
+class StepCache(object):
+    """On-disk cache of Steps that have been validated by cwltool.
+
+    Cache entries are keyed on the absolute path (or url) and contents of the
+    CWL file, and on the version of cwltool that was used to validate it. So,
+    if either of them changes, the step is validated again. The key of a
+    local workflow also includes the contents of the local files its steps
+    run (see ``run_targets``), so the workflow is validated again if one of
+    them changes. CWL files fetched from urls are stored in ``http_cache``
+    (see ``scriptcwl.remote``).
+
+    Args:
+        cache_dir (str): directory to store the cache entries in.
+        max_size (int, optional): maximum size of the cache in bytes. If the
+            cache grows larger, the least recently used entries are removed
+            (default: None, meaning no maximum).
+    """
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self._version = '{}-{}'.format(CACHE_FORMAT, cwltool_version())
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.http_cache = HTTPCache(os.path.join(self.cache_dir, 'http'))
+
+    def key(self, fname, text=None):
+        """Return the cache key for a CWL file.
+
+        Args:
+            fname (str): path or url of the CWL file.
+            text (str, optional): the contents of the CWL file, required for
+                urls.
+
+        Returns:
+            str: the key, or None if the file cannot be cached.
+        """
+        if is_url(fname):
+            if text is None:
+                return None
+            content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            dependencies = []
+        elif os.path.isfile(fname):
+            fname = os.path.abspath(fname)
+            content_hash = file_hash(fname)
+            dependencies = run_targets(fname)
+        else:
+            return None
+        h = hashlib.sha256()
+        h.update(self._version.encode('utf-8'))
+        h.update(fname.encode('utf-8'))
+        h.update(content_hash.encode('utf-8'))
+        for dep in dependencies:
+            h.update(dep.encode('utf-8'))
+            if os.path.isfile(dep):
+                h.update(file_hash(dep).encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, '{}.pickle'.format(key))
+
+    def get(self, fname, text=None):
+        """Return the cached Step for a CWL file.
+
+        Args:
+            fname (str): path or url of the CWL file.
+            text (str, optional): the contents of the CWL file, required for
+                urls.
+
+        Returns:
+            Step: the cached step, or None if the file is not in the cache.
+        """
+        key = self.key(fname, text=text)
+        if key is None:
+            return None
+        entry = self._entry(key)
+        try:
+            with open(entry, 'rb') as f:
+                step = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logger.debug('Ignoring cache entry "{}": {}'.format(entry, e))
+            return None
+        # Keep track of when the entry was used for pruning the cache
+        os.utime(entry, None)
+        logger.debug('Loaded "{}" from cache'.format(fname))
+        return step
+
+    def put(self, fname, step, text=None):
+        """Add a Step to the cache.
+
+        Args:
+            fname (str): the CWL file the step was loaded from.
+            step (Step): the step.
+            text (str, optional): the contents of the CWL file, required for
+                urls.
+        """
+        key = self.key(fname, text=text)
+        if key is None:
+            return
+        entry = self._entry(key)
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(step, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, entry)
+
+        if self.max_size is not None:
+            self.prune(self.max_size)
+
+    def _entries(self):
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.pickle'):
+                entry = os.path.join(self.cache_dir, fname)
+                entries.append((os.stat(entry), entry))
+        return entries
+
+    def size(self):
+        """Return the total size of the cache entries in bytes."""
+        return sum([st.st_size for st, _ in self._entries()])
+
+    def prune(self, max_size):
+        """Remove the least recently used entries until the cache is smaller
+        than ``max_size`` bytes.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[0].st_mtime)
+        size = sum([st.st_size for st, _ in entries])
+        for st, entry in entries:
+            if size <= max_size:
+                break
+            os.remove(entry)
+            size -= st.st_size
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for _, entry in self._entries():
+            os.remove(entry)
+        self.http_cache.clear()
@@ -1,18 +1,27 @@
+import atexit
 import os
-import glob
+import re
 import shutil
+import fnmatch
+import filecmp
 import logging
+import pickle
 import sys
+import tempfile
+import threading
 import warnings
 
 from six.moves.urllib.parse import urlparse
 
-from schema_salad.validate import ValidationException
-
 from ruamel import yaml
 
-from .scriptcwl import is_url
-from .step import Step, PackedWorkflowException
+from .bundle import read_bundle_index, extract_steps
+from .cache import CACHE_FORMAT, StepCache, cwltool_version, file_hash
+from .remote import fetch_urls
+from .scriptcwl import is_url, new_loading_context
+from .listing import StepListing
+from .step import Step, PackedWorkflowException, python_name, step_name
+from .typeindex import TypeIndex
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
@@ -24,51 +33,495 @@ logger.addHandler(fh)
 
 class StepsLibrary(object):
     """Oject to store steps that can be used to build workflows
+
+    If the library is ``lazy``, loading steps only registers their names.
+    Steps are validated when they are used for the first time. If the library
+    is ``trusted``, local CWL files are not validated at all (see
+    ``scriptcwl.trusted``).
+
+    If a working directory is set, the CWL files are staged in the working
+    directory before they are loaded. How they are staged is determined by
+    ``staging`` (see ``stage_file``).
+
+    A steps library can be shared by multiple WorkflowGenerators, also in
+    different threads. The steps in the library are never changed by a
+    WorkflowGenerator; the state of a workflow is kept in the
+    WorkflowGenerator. After calling ``freeze()``, no more steps can be
+    loaded into the library.
     """
-    def __init__(self, working_dir=None):
+    def __init__(self, working_dir=None, workers=None, cache_dir=None,
+                 lazy=False, staging='changed', trusted=False):
+        if staging not in STAGING_STRATEGIES:
+            msg = 'Illegal staging "{}". Choose one of ({}).'\
+                  .format(staging, ','.join(STAGING_STRATEGIES))
+            raise ValueError(msg)
+
         self.steps = {}
-        self.step_ids = []
+        self.step_files = {}
         self.working_dir = working_dir
+        self.workers = workers
+        self.lazy = lazy
+        self.staging = staging
+        self.trusted = trusted
         self.python_names2step_names = {}
+        self.type_index = TypeIndex()
+        self.listing = StepListing()
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = StepCache(cache_dir)
+
+        # Directories and files loaded, and the state of the local CWL files
+        # when they were loaded, for refreshing the library
+        self.sources = []
+        self.scan_options = {}
+        self.file_states = {}
+        self.step_sources = {}
+
+        # Bundles loaded, and the index entries of steps in bundles that have
+        # not been extracted yet
+        self.bundles = []
+        self.bundle_entries = {}
+        # bundle -> (directory the steps are extracted to, index), so the
+        # bundle is hashed and its index is read only once
+        self._bundle_info = {}
+        self._bundle_dir = None
 
-    def load(self, steps_dir=None, step_file=None, step_list=None):
-        steps_to_load = load_steps(working_dir=self.working_dir,
-                                   steps_dir=steps_dir,
-                                   step_file=step_file,
-                                   step_list=step_list)
+        self.frozen = False
+        self._lock = threading.RLock()
+
+    def load(self, steps_dir=None, step_file=None, step_list=None,
+             workers=None, bundle=None, recursive=False, include=None,
+             exclude=None):
+        scan_options = {'recursive': recursive, 'include': include,
+                        'exclude': exclude}
+        step_files = iter_step_files(steps_dir=steps_dir,
+                                     step_file=step_file,
+                                     step_list=step_list, **scan_options)
+        with self._lock:
+            self._check_frozen()
+            if bundle is not None:
+                self._add_bundle(bundle)
+            for src in [steps_dir, step_file] + list(step_list or []):
+                if src is not None and not is_url(src):
+                    if src not in self.sources:
+                        self.sources.append(src)
+                    if os.path.isdir(src):
+                        self.scan_options[src] = scan_options
+            self._add_files(step_files, workers=workers)
+
+    def _add_files(self, step_files, workers=None):
+        """Add the steps in a list (or iterator) of CWL files to the library.
+        """
+        sources = {}
+        files = []
+        for f in step_files:
+            files.append(f)
+            sources[step_name(f)] = f
+            if not is_url(f):
+                self.file_states[f] = file_state(f)
+
+        if workers is None:
+            workers = self.workers
+        step_files = stage_step_files(files, self.working_dir,
+                                      staging=self.staging, workers=workers)
+
+        if self.lazy:
+            names = {}
+            for f in step_files:
+                names[step_name(f)] = f
+            for n, f in names.items():
+                if self._can_add(n, python_name(n)):
+                    self.step_files[n] = f
+                    self.python_names2step_names[python_name(n)] = n
+                    self.step_sources[n] = sources[n]
+            return
+
+        results = create_steps(step_files, workers=workers, cache=self.cache,
+                               trusted=self.trusted)
+        steps_to_load = collect_steps(results)
 
         for n, step in steps_to_load.items():
-            if n in self.steps.keys():
-                msg = 'Step "{}" already in steps library.'.format(n)
-                warnings.warn(UserWarning(msg))
-            elif step.python_name in self.python_names2step_names.keys():
-                pn = self.python_names2step_names.get(step.python_name)
-                msg = 'step "{}.cwl" has the same python name as "{}.cwl". ' \
-                      'Please rename file "{}.cwl", so it can be ' \
-                      'loaded.'.format(n, pn, n)
-                warnings.warn(UserWarning(msg))
-            else:
-                self.steps[n] = step
+            if self._can_add(n, step.python_name):
+                self._add_step(n, step)
                 self.python_names2step_names[step.python_name] = n
+                self.step_sources[n] = sources[n]
+
+    def _add_bundle(self, fname):
+        """Add the steps in a bundle to the library.
+
+        Only the index of the bundle is read. Steps are extracted (and
+        staged in the working directory, if it is set) when they are used
+        for the first time. They were validated when the bundle was
+        created, so they are loaded without validating them again (see
+        ``scriptcwl.trusted``).
+        """
+        index = read_bundle_index(fname)
+        self._bundle_info[fname] = (self._bundle_extract_dir(fname), index)
+        target_dir = self.working_dir
+        if target_dir is None:
+            target_dir = self._bundle_info[fname][0]
+        if fname not in self.bundles:
+            self.bundles.append(fname)
+
+        for entry in index['steps']:
+            n = entry['name']
+            if 'error' in entry:
+                logger.warning(entry['error'])
+            elif self._can_add(n, entry['python_name']):
+                self.step_files[n] = os.path.join(target_dir, entry['file'])
+                self.bundle_entries[n] = (fname, entry)
+                self.python_names2step_names[entry['python_name']] = n
+                self.step_sources[n] = fname
+
+    def _bundle_extract_dir(self, fname):
+        """Return the directory to extract the steps of a bundle to.
+
+        If the library has a cache directory, steps are extracted to a
+        directory in the cache that is specific for the contents of the
+        bundle, so they are extracted only once. Otherwise, they are
+        extracted to a temporary directory that is removed when Python
+        exits.
+        """
+        if self.cache is not None:
+            extract_dir = os.path.join(self.cache.cache_dir, 'bundles',
+                                       file_hash(fname))
+            if not os.path.exists(extract_dir):
+                os.makedirs(extract_dir)
+            return extract_dir
+        if self._bundle_dir is None:
+            self._bundle_dir = temporary_dir()
+        return self._bundle_dir
+
+    def _extract(self, names):
+        """Extract steps from bundles.
+
+        If a (sub)workflow is extracted, all steps in its bundle are
+        extracted, because the workflow may refer to them. If the library
+        has a working directory, the extracted steps are staged in the
+        working directory.
+        """
+        for n in names:
+            if n not in self.bundle_entries:
+                continue
+            fname, entry = self.bundle_entries.pop(n)
+            extract_dir, index = self._bundle_info[fname]
+            if entry.get('is_workflow'):
+                entries = index['steps']
+            else:
+                entries = [entry]
+            entries = [e for e in entries if 'error' not in e]
+            extract_steps(fname, entries, extract_dir)
+
+            if self.working_dir is not None:
+                staging = self.staging
+                if staging == 'symlink' and self.cache is None:
+                    # links to a temporary directory would break
+                    staging = 'changed'
+                if not os.path.exists(self.working_dir):
+                    os.makedirs(self.working_dir)
+                for e in entries:
+                    stage_file(os.path.join(extract_dir, e['file']),
+                               os.path.join(self.working_dir, e['file']),
+                               staging=staging)
+
+    def _remove(self, name, source):
+        """Remove a step from the library, if it was loaded from source.
+        """
+        if self.step_sources.get(name) != source:
+            return
+        self.steps.pop(name, None)
+        self.type_index.remove(name)
+        self.listing.remove(name)
+        self.step_files.pop(name, None)
+        self.bundle_entries.pop(name, None)
+        self.python_names2step_names.pop(python_name(name), None)
+        del self.step_sources[name]
+
+    def refresh(self, workers=None):
+        """Update the library with changes in the loaded CWL files.
+
+        The directories and files that were loaded before are checked for
+        CWL files that were added, modified or deleted. Only those files are
+        (re)loaded. Steps loaded from a url are not refreshed.
+
+        Args:
+            workers (int, optional): number of processes used to validate the
+                CWL files.
+
+        Returns:
+            dict containing the sorted names of the steps that were
+            ``added``, ``modified`` and ``deleted``.
+        """
+        with self._lock:
+            self._check_frozen()
+            return self._refresh(workers=workers)
+
+    def _refresh(self, workers=None):
+        step_files = []
+        for src in self.sources:
+            step_files += [f for f in iter_step_files(
+                step_list=[src], **self.scan_options.get(src, {}))
+                if os.path.isfile(f)]
+        current = {}
+        for f in step_files:
+            current[f] = file_state(f)
+
+        added = [f for f in step_files if f not in self.file_states]
+        modified = [f for f in step_files if f in self.file_states and
+                    current[f] != self.file_states[f]]
+        deleted = [f for f in self.file_states if f not in current]
+
+        for f in modified + deleted:
+            del self.file_states[f]
+            self._remove(step_name(f), f)
+        self._add_files([f for f in step_files if f in current and
+                         f not in self.file_states], workers=workers)
+
+        return {'added': sorted([step_name(f) for f in added]),
+                'modified': sorted([step_name(f) for f in modified]),
+                'deleted': sorted([step_name(f) for f in deleted])}
+
+    def freeze(self):
+        """Prevent loading, refreshing or removing steps.
+
+        The library can then safely be shared by WorkflowGenerators. Steps
+        in a lazy library are still validated when they are first used.
+        """
+        with self._lock:
+            self.frozen = True
+
+    def _check_frozen(self):
+        if self.frozen:
+            raise ValueError('Operation on frozen StepsLibrary.')
+
+    def save_snapshot(self, fname):
+        """Save the steps in the library to a snapshot file.
+
+        The snapshot contains the validated steps and a manifest of the
+        hashes of the CWL files that were loaded. Steps that have not
+        been validated yet (in a lazy library) are validated first.
+
+        Args:
+            fname (str): the file to save the snapshot to.
+        """
+        with self._lock:
+            self._validate(list(self.step_files.keys()))
+
+            manifest = {}
+            for src in self.file_states.keys():
+                if os.path.isfile(src):
+                    manifest[src] = file_hash(src)
+            snapshot = {
+                'version': '{}-{}'.format(CACHE_FORMAT, cwltool_version()),
+                'working_dir': self.working_dir,
+                'sources': self.sources,
+                'bundles': self.bundles,
+                'scan_options': self.scan_options,
+                'steps': self.steps,
+                'step_sources': self.step_sources,
+                'manifest': manifest
+            }
+
+        tmp = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, fname)
+
+    @classmethod
+    def from_snapshot(cls, fname, verify=True, update=True, **kwargs):
+        """Create a steps library from a snapshot file.
+
+        If the snapshot was created with another version of cwltool or
+        scriptcwl, the steps are loaded again from the loaded directories,
+        files, urls and bundles.
+
+        Args:
+            fname (str): the snapshot file (see ``save_snapshot``).
+            verify (bool): whether to compare the hashes of the CWL files to
+                the manifest of the snapshot. Steps from CWL files that were
+                changed or deleted are reloaded or removed, and CWL files
+                that were added to the loaded directories are loaded
+                (default: True).
+            update (bool): whether to save the snapshot again, if it turns
+                out to be stale (default: True).
+            kwargs: arguments for creating the StepsLibrary (``workers``,
+                ``cache_dir``, ``lazy``).
+
+        Returns:
+            StepsLibrary
+        """
+        with open(fname, 'rb') as f:
+            snapshot = pickle.load(f)
+
+        lib = cls(working_dir=snapshot['working_dir'], **kwargs)
+        lib.sources = snapshot['sources']
+        lib.scan_options = snapshot.get('scan_options', {})
+        version = '{}-{}'.format(CACHE_FORMAT, cwltool_version())
+        if snapshot['version'] != version:
+            # steps were validated with another version of cwltool (or
+            # scriptcwl), so all steps are loaded again
+            logger.info('Snapshot "{}" is outdated'.format(fname))
+            for src in lib.sources:
+                lib.load(step_list=[src], **lib.scan_options.get(src, {}))
+            # steps from urls are not in the sources, they are fetched again
+            urls = sorted(set([src for src in snapshot['step_sources'].values()
+                               if is_url(src)]))
+            if urls:
+                lib.load(step_list=urls)
+            for bundle in snapshot.get('bundles', []):
+                lib.load(bundle=bundle)
+        else:
+            lib.bundles = snapshot.get('bundles', [])
+            lib.step_sources = snapshot['step_sources']
+            for n, step in snapshot['steps'].items():
+                lib._add_step(n, step)
+                lib.python_names2step_names[step.python_name] = n
+            for src, h in snapshot['manifest'].items():
+                # if the hash does not match, the state does not match, so
+                # the step is reloaded by refresh
+                if os.path.isfile(src) and (not verify or
+                                            file_hash(src) == h):
+                    lib.file_states[src] = file_state(src)
+                else:
+                    lib.file_states[src] = None
+            if not verify:
+                return lib
+
+            changes = lib.refresh()
+            if not any(changes.values()):
+                return lib
+            logger.info('Snapshot "{}" is stale: {}'.format(fname, changes))
+
+        if update:
+            lib.save_snapshot(fname)
+        return lib
+
+    def _can_add(self, name, python_name):
+        """Return True if a step can be added to the library, and warn if it
+        cannot be added.
+        """
+        if name in self.steps.keys() or name in self.step_files.keys():
+            msg = 'Step "{}" already in steps library.'.format(name)
+            warnings.warn(UserWarning(msg))
+        elif python_name in self.python_names2step_names.keys():
+            pn = self.python_names2step_names.get(python_name)
+            msg = 'step "{}.cwl" has the same python name as "{}.cwl". ' \
+                  'Please rename file "{}.cwl", so it can be ' \
+                  'loaded.'.format(name, pn, name)
+            warnings.warn(UserWarning(msg))
+        else:
+            return True
+        return False
+
+    def _validate(self, names):
+        """Validate steps that have been registered, but not yet loaded.
+
+        Steps that cannot be loaded are removed from the library.
+        """
+        names = [n for n in names if n in self.step_files]
+        if not names:
+            return
+        # steps from bundles were validated when the bundle was created
+        bundled = [n for n in names if n in self.bundle_entries]
+        others = [n for n in names if n not in self.bundle_entries]
+        self._extract(names)
+
+        results = {}
+        for group, trusted in ((bundled, True), (others, self.trusted)):
+            if not group:
+                continue
+            step_files = [self.step_files.pop(n) for n in group]
+            group_results = create_steps(step_files, workers=self.workers,
+                                         cache=self.cache, trusted=trusted)
+            results.update(zip(group, group_results))
+
+        for n in names:
+            step, error = results[n]
+            if step is None:
+                logger.warning(error)
+                del self.python_names2step_names[python_name(n)]
+            else:
+                self._add_step(n, step)
+
+    def _add_step(self, name, step):
+        """Add a validated step to the library and its indexes."""
+        self.steps[name] = step
+        self.type_index.add(step)
+        self.listing.add(step)
 
     def get_step(self, name):
-        return self.steps.get(name)
+        step = self.steps.get(name)
+        if step is None:
+            with self._lock:
+                self._validate([name])
+                step = self.steps.get(name)
+        return step
+
+    def steps_consuming(self, typ, optional=True):
+        """Return the names of the steps that have an input of a type.
+
+        Types are normalized, so ``'File[]'`` also matches inputs of type
+        ``File[]?`` and ``{'type': 'array', 'items': 'File'}`` (see
+        ``scriptcwl.typeindex.type_keys``).
+
+        Args:
+            typ: a CWL type, e.g., ``'File[]'``.
+            optional (bool): whether to include steps for which inputs of
+                this type are optional (default: True).
+
+        Returns:
+            sorted list of step names.
+        """
+        with self._lock:
+            self._validate(list(self.step_files.keys()))
+            return self.type_index.consuming(typ, optional=optional)
+
+    def steps_producing(self, typ):
+        """Return the names of the steps that have an output of a type.
+
+        Args:
+            typ: a CWL type, e.g., ``'Directory'``.
+
+        Returns:
+            sorted list of step names.
+        """
+        with self._lock:
+            self._validate(list(self.step_files.keys()))
+            return self.type_index.producing(typ)
 
     def list_steps(self):
-        steps = []
-        workflows = []
-        template = u'  {:.<25} {}'
-        for name, step in self.steps.items():
-            if step.is_workflow:
-                workflows.append(template.format(name, step))
-            else:
-                steps.append(template.format(name, step))
+        """Return string with the signature of all steps in the library.
+
+        The listing is kept up to date while steps are loaded, so it is not
+        created again on every call.
+        """
+        with self._lock:
+            self._validate(list(self.step_files.keys()))
+            return self.listing.text()
+
+    def step_signatures(self, workflows=None, pattern=None, offset=0,
+                        limit=None):
+        """Return the signatures of the steps in the library, sorted by name.
 
-        steps.sort()
-        workflows.sort()
-        result = [u'Steps\n', u'\n'.join(steps), u'\n\nWorkflows\n',
-                  u'\n'.join(workflows)]
-        return u''.join(result)
+        Args:
+            workflows (bool, optional): if True, only return workflows, if
+                False, only return steps that are not workflows (default:
+                None, meaning all steps).
+            pattern (str, optional): glob pattern the names of the steps
+                should match (default: None).
+            offset (int, optional): number of matching steps to skip, for
+                paging through the steps (default: 0).
+            limit (int, optional): maximum number of steps to return
+                (default: None, meaning no maximum).
+
+        Returns:
+            list of dicts containing the ``name``, ``python_name``,
+            ``is_workflow`` and ``signature`` of the steps.
+        """
+        with self._lock:
+            self._validate(list(self.step_files.keys()))
+            return self.listing.entries(workflows=workflows, pattern=pattern,
+                                        offset=offset, limit=limit)
 
 
 def name_in_workflow(iri):
@@ -80,8 +533,57 @@ def name_in_workflow(iri):
     return None
 
 
+def create_step(fname, loading_context=None, text=None, trusted=False):
+    """Create a Step from a CWL file.
+
+    Steps that cannot be loaded are not raised, but returned as an error
+    message, so they can be reported in loading order.
+
+    Args:
+        fname (str): path or http(s) url to a CWL file.
+        loading_context (LoadingContext, optional): cwltool loading context
+            shared with the other steps that are loaded.
+        text (str, optional): the contents of the CWL file, if it was
+            already fetched from a url. cwltool then does not fetch it again.
+        trusted (bool, optional): whether to load a local CWL file without
+            validating it (default: False).
+
+    Returns:
+        tuple (Step, None) if the step was loaded, (None, str) otherwise.
+    """
+    from schema_salad.validate import ValidationException
+
+    if text is not None:
+        if loading_context is None:
+            loading_context = new_loading_context()
+        if loading_context is not None:
+            loading_context.loader.cache[fname] = text
+
+    try:
+        return Step(fname, loading_context=loading_context,
+                    trusted=trusted), None
+    except (NotImplementedError, ValidationException,
+            PackedWorkflowException) as e:
+        return None, str(e)
+
+
+# Loading context shared by the steps created in a worker process
+_worker_loading_context = None
+
+
+def _init_worker():
+    global _worker_loading_context
+    _worker_loading_context = new_loading_context()
+
+
+def _create_step_in_worker(fname, text=None, trusted=False):
+    return create_step(fname, loading_context=_worker_loading_context,
+                       text=text, trusted=trusted)
+
+
 def load_steps(working_dir=None, steps_dir=None, step_file=None,
-               step_list=None):
+               step_list=None, workers=None, cache=None, recursive=False,
+               include=None, exclude=None, staging='changed', trusted=False):
     """Return a dictionary containing Steps read from file.
 
     Args:
@@ -89,48 +591,421 @@ def load_steps(working_dir=None, steps_dir=None, step_file=None,
         step_file (str, optional): path or http(s) url to a single CWL file.
         step_list (list, optional): a list of directories, urls or local file
             paths to CWL files or directories containing CWL files.
+        workers (int, optional): number of processes used to validate the
+            CWL files. Steps are loaded one after the other if ``workers`` is
+            ``None`` or smaller than 2 (default: None).
+        cache (StepCache, optional): cache of validated steps. Steps found in
+            the cache are not validated again, newly validated steps are
+            added to the cache (default: None).
+        recursive (bool, optional): whether to load the CWL files in
+            subdirectories of the directories (default: False).
+        include (list, optional): glob patterns of the files to load from
+            directories (default: ``['*.cwl']``).
+        exclude (list, optional): glob patterns of files and directories to
+            skip (default: None).
+        staging (str, optional): how to stage the CWL files in the working
+            directory (see ``stage_file``; default: ``changed``).
+        trusted (bool, optional): whether to load local CWL files without
+            validating them (default: False).
 
     Return:
         dict containing (name, Step) entries.
 
     """
+    step_files = find_step_files(steps_dir=steps_dir,
+                                 step_file=step_file,
+                                 step_list=step_list, recursive=recursive,
+                                 include=include, exclude=exclude)
+    step_files = stage_step_files(step_files, working_dir, staging=staging,
+                                  workers=workers)
+    results = create_steps(step_files, workers=workers, cache=cache,
+                           trusted=trusted)
+
+    return collect_steps(results)
+
+
+def find_step_files(steps_dir=None, step_file=None, step_list=None,
+                    recursive=False, include=None, exclude=None):
+    """Return the list of CWL files to load steps from.
+
+    See ``iter_step_files``.
+
+    Return:
+        list of paths and urls.
+    """
+    return list(iter_step_files(steps_dir=steps_dir, step_file=step_file,
+                                step_list=step_list, recursive=recursive,
+                                include=include, exclude=exclude))
+
+
+def iter_step_files(steps_dir=None, step_file=None, step_list=None,
+                    recursive=False, include=None, exclude=None):
+    """Generate the CWL files to load steps from.
+
+    Args:
+        steps_dir (str, optional): path to directory containing CWL files.
+        step_file (str, optional): path or http(s) url to a single CWL file.
+        step_list (list, optional): a list of directories, urls or local file
+            paths to CWL files or directories containing CWL files.
+        recursive (bool, optional): whether to scan subdirectories of the
+            directories (default: False).
+        include (list, optional): glob patterns of the files to load from
+            directories (default: ``['*.cwl']``).
+        exclude (list, optional): glob patterns of files and directories to
+            skip (default: None).
+
+    Steps are named after their file names. If multiple files have the same
+    name (e.g., ``a/echo.cwl`` and ``b/echo.cwl`` in a recursive scan), only
+    the first one is generated and a warning is given for the others.
+
+    Yields:
+        paths and urls.
+    """
     if steps_dir is not None:
-        step_files = glob.glob(os.path.join(steps_dir, '*.cwl'))
+        paths = [steps_dir] if os.path.isdir(steps_dir) else []
     elif step_file is not None:
-        step_files = [step_file]
+        yield step_file
+        return
     elif step_list is not None:
-        step_files = []
-        for path in step_list:
-            if os.path.isdir(path):
-                step_files += glob.glob(os.path.join(path, '*.cwl'))
-            else:
-                step_files.append(path)
+        paths = step_list
     else:
-        step_files = []
+        paths = []
+
+    # step name -> file
+    seen = {}
+    for path in paths:
+        if not is_url(path) and os.path.isdir(path):
+            files = scan_dir(path, recursive=recursive, include=include,
+                             exclude=exclude)
+        else:
+            files = [path]
+        for f in files:
+            n = step_name(f)
+            if n in seen:
+                if seen[n] != f:
+                    msg = 'Not loading "{}", because step "{}" is loaded ' \
+                          'from "{}".'.format(f, n, seen[n])
+                    warnings.warn(UserWarning(msg))
+                continue
+            seen[n] = f
+            yield f
+
+
+# Directories that are never scanned for CWL files
+SKIPPED_DIRS = frozenset(['node_modules', '__pycache__', 'site-packages',
+                          'venv', 'vendor', 'third_party'])
+
+
+def scan_dir(path, recursive=False, include=None, exclude=None):
+    """Generate the files in a directory that match the include patterns.
+
+    The directory is scanned with ``os.scandir``, so files are generated
+    while scanning. Hidden files and directories are skipped, and so are
+    directories containing vendored code (see ``SKIPPED_DIRS``). Symbolic
+    links to directories are not followed.
+
+    Patterns are matched against the name of a file or directory and
+    against its path relative to ``path``.
+
+    Args:
+        path (str): the directory to scan.
+        recursive (bool, optional): whether to scan subdirectories
+            (default: False).
+        include (list, optional): glob patterns of the files to generate
+            (default: ``['*.cwl']``).
+        exclude (list, optional): glob patterns of files and directories to
+            skip (default: None).
 
+    Yields:
+        str: paths of the files that were found.
+    """
+    if include is None:
+        include = ['*.cwl']
+    if exclude is None:
+        exclude = []
+
+    dirs = [path]
+    while dirs:
+        current = dirs.pop()
+        subdirs = []
+        try:
+            entries = os.scandir(current)
+        except OSError as e:
+            logger.warning('Cannot scan "{}": {}'.format(current, e))
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                relpath = os.path.relpath(entry.path, path)
+                if _matches(entry.name, relpath, exclude):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if recursive and entry.name not in SKIPPED_DIRS:
+                        subdirs.append(entry.path)
+                elif _matches(entry.name, relpath, include):
+                    yield entry.path
+        # scan subdirectories in alphabetical order
+        dirs += sorted(subdirs, reverse=True)
+
+
+def _matches(name, relpath, patterns):
+    relpath = relpath.replace(os.sep, '/')
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or \
+                fnmatch.fnmatch(relpath, pattern):
+            return True
+    return False
+
+
+def stage_step_files(step_files, working_dir=None, staging='changed',
+                     workers=None):
+    """Prepare a list of CWL files for loading.
+
+    If a working directory is given, the files are sorted into the correct
+    loading order and staged in the working directory (see ``stage_file``).
+
+    Args:
+        step_files (list): paths and urls of CWL files.
+        working_dir (str, optional): the working directory.
+        staging (str, optional): how to stage the files (default:
+            ``changed``).
+        workers (int, optional): number of threads used to stage the files
+            (default: None, meaning one after the other).
+
+    Return:
+        list of paths and urls to load the steps from.
+    """
     if working_dir is not None:
         step_files = sort_loading_order(step_files)
 
-    steps = {}
+        # Stage all files in working_dir before validating any of them, so
+        # workflows can find their steps, also when loading in parallel
+        def stage(f):
+            return copy_to_working_dir(f, working_dir, staging=staging)
+
+        if workers is not None and workers > 1 and len(step_files) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                step_files = list(executor.map(stage, step_files))
+        else:
+            step_files = [stage(f) for f in step_files]
+
+    return step_files
+
+
+def file_state(fname):
+    """Return the modification time and size of a file."""
+    st = os.stat(fname)
+    return st.st_mtime, st.st_size
+
+
+def create_steps(step_files, workers=None, cache=None, trusted=False):
+    """Create Steps for a list of CWL files.
+
+    All steps are loaded with the same cwltool loading context (or one per
+    worker process, when loading in parallel). CWL files from urls are
+    fetched concurrently first (see ``scriptcwl.remote``). With a cache, the
+    fetched files are cached as well, and steps from urls that were not
+    modified are not validated again.
+
+    Args:
+        step_files (list): paths or http(s) urls of CWL files.
+        workers (int, optional): number of processes used to validate the
+            CWL files (default: None).
+        cache (StepCache, optional): cache of validated steps
+            (default: None). Steps that were loaded without validating them
+            are not added to the cache.
+        trusted (bool, optional): whether to load local CWL files without
+            validating them (default: False).
+
+    Returns:
+        list of (Step, error message) tuples (see ``create_step``), in the
+        order of ``step_files``.
+    """
+    results = {}
+    texts = {}
+    urls = sorted(set([f for f in step_files if is_url(f)]))
+    http_cache = cache.http_cache if cache is not None else None
+    for url, (text, error) in zip(urls, fetch_urls(urls, cache=http_cache)):
+        if text is None:
+            results[url] = (None, error)
+        else:
+            texts[url] = text
+
+    if cache is not None:
+        for f in step_files:
+            if f in results:
+                continue
+            s = cache.get(f, text=texts.get(f))
+            if s is not None:
+                results[f] = (s, None)
+    # Files that are listed more than once are only loaded once
+    files_to_create = []
+    seen = set(results.keys())
     for f in step_files:
-        if working_dir is not None:
-            # Copy file to working_dir
-            if not working_dir == os.path.dirname(f) and not is_url(f):
-                copied_file = os.path.join(working_dir, os.path.basename(f))
-                shutil.copy2(f, copied_file)
-                f = copied_file
-
-        # Create steps
-        try:
-            s = Step(f)
+        if f not in seen:
+            files_to_create.append(f)
+            seen.add(f)
+
+    if workers is not None and workers > 1 and len(files_to_create) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker) as executor:
+            created = list(executor.map(
+                _create_step_in_worker, files_to_create,
+                [texts.get(f) for f in files_to_create],
+                [trusted] * len(files_to_create)))
+    else:
+        # In trusted mode, cwltool is only imported if a file cannot be
+        # loaded without it
+        loading_context = None if trusted else new_loading_context()
+        created = [create_step(f, loading_context=loading_context,
+                               text=texts.get(f), trusted=trusted)
+                   for f in files_to_create]
+
+    for f, result in zip(files_to_create, created):
+        results[f] = result
+        if cache is not None and result[0] is not None and \
+                (not trusted or is_url(f)):
+            cache.put(f, result[0], text=texts.get(f))
+
+    return [results[f] for f in step_files]
+
+
+def collect_steps(results):
+    """Return a dictionary containing the Steps that were created.
+
+    Errors are logged as warnings.
+
+    Args:
+        results (list): (Step, error message) tuples returned by
+            ``create_steps``.
+
+    Return:
+        dict containing (name, Step) entries.
+    """
+    steps = {}
+    for s, error in results:
+        if s is None:
+            logger.warning(error)
+        else:
             steps[s.name] = s
-        except (NotImplementedError, ValidationException,
-                PackedWorkflowException) as e:
-            logger.warning(e)
 
     return steps
 
 
+def temporary_dir():
+    """Create a temporary directory that is removed when Python exits."""
+    tmp_dir = tempfile.mkdtemp(prefix='scriptcwl-')
+    atexit.register(shutil.rmtree, tmp_dir, True)
+    return tmp_dir
+
+
+def copy_to_working_dir(fname, working_dir, staging='changed'):
+    """Stage a step file in the working directory.
+
+    Returns:
+        str: the path of the file to load the step from.
+    """
+    if working_dir == os.path.dirname(fname) or is_url(fname):
+        return fname
+    copied_file = os.path.join(working_dir, os.path.basename(fname))
+    stage_file(fname, copied_file, staging=staging)
+    return copied_file
+
+
+# Ways to stage CWL files in the working directory
+STAGING_STRATEGIES = ('copy', 'changed', 'hardlink', 'symlink', 'reflink')
+
+# ioctl request to clone a file (Linux)
+FICLONE = 0x40049409
+
+
+def stage_file(src, dst, staging='changed'):
+    """Make the contents of ``src`` available as ``dst``.
+
+    Staging strategies:
+
+    * ``copy``: always copy the file.
+    * ``changed``: only copy the file if ``dst`` does not exist or its
+      contents differ from ``src``.
+    * ``hardlink``: create a hard link to ``src``.
+    * ``symlink``: create a symbolic link to (the absolute path of) ``src``.
+    * ``reflink``: create a copy-on-write clone of ``src``, on file systems
+      that support it (e.g., btrfs and XFS).
+
+    If a link or clone cannot be created (e.g., because ``src`` and ``dst``
+    are on different file systems), the file is copied if it changed.
+
+    Args:
+        src (str): the file to stage.
+        dst (str): where to stage the file.
+        staging (str, optional): the staging strategy (default:
+            ``changed``).
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+
+    if staging == 'copy':
+        _replace(src, dst, shutil.copy2)
+        return
+
+    try:
+        if staging == 'hardlink':
+            _replace(src, dst, os.link)
+            return
+        elif staging == 'symlink':
+            _replace(os.path.abspath(src), dst, os.symlink)
+            return
+        elif staging == 'reflink' and _changed(src, dst):
+            _replace(src, dst, _reflink)
+            return
+    except (OSError, ImportError) as e:
+        logger.debug('Cannot {} "{}": {}'.format(staging, src, e))
+
+    if _changed(src, dst):
+        _replace(src, dst, shutil.copy2)
+
+
+def _changed(src, dst):
+    """Return True if ``dst`` is not a regular file with the same contents as
+    ``src``.
+    """
+    return os.path.islink(dst) or not os.path.isfile(dst) or \
+        not filecmp.cmp(src, dst, shallow=False)
+
+
+def _replace(src, dst, create):
+    """Create ``dst`` from ``src`` with ``create(src, tmp)``, and replace
+    ``dst`` with it.
+
+    Existing files are replaced instead of overwritten, so files that
+    ``dst`` is (hard) linked to are never changed.
+    """
+    tmp = '{}.{}.{}.tmp'.format(dst, os.getpid(), threading.get_ident())
+    try:
+        create(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
 def load_yaml(filename):
     """Return object in yaml file."""
     with open(filename) as myfile:
@@ -168,16 +1043,78 @@ def sort_loading_order(step_files):
         if f.startswith('http://') or f.startswith('https://'):
             tools.append(f)
         else:
-            obj = load_yaml(f)
-            if obj.get('class', '') == 'Workflow':
-                if 'requirements' in obj.keys():
-                    subw = {'class': 'SubworkflowFeatureRequirement'}
-                    if subw in obj['requirements']:
-                        workflows_with_subworkflows.append(f)
-                    else:
-                        workflows.append(f)
+            header = scan_header(f)
+            if header is None:
+                # fall back to parsing the complete file
+                obj = load_yaml(f)
+                subw = {'class': 'SubworkflowFeatureRequirement'}
+                requirements = obj.get('requirements', [])
+                header = {'class': obj.get('class'),
+                          'subworkflows': isinstance(requirements, list) and
+                          subw in requirements}
+            if header['class'] == 'Workflow':
+                if header['subworkflows']:
+                    workflows_with_subworkflows.append(f)
                 else:
                     workflows.append(f)
             else:
                 tools.append(f)
     return tools + workflows + workflows_with_subworkflows
+
+
+TOP_LEVEL_KEY = re.compile(r'^([$\w]+)\s*:(.*)$')
+
+
+def scan_header(filename):
+    """Return the class of a CWL file and whether it requires subworkflows.
+
+    Instead of parsing the complete file, the top-level keys are scanned
+    line by line, until the ``class`` (and for workflows, the
+    ``requirements``) are found. This only works for block style YAML.
+
+    Returns:
+        dict containing ``class`` and ``subworkflows``, or None if the file
+        could not be scanned.
+    """
+    header = {}
+    in_requirements = False
+    with open(filename) as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#') or \
+                    stripped == '---':
+                continue
+
+            # indented lines and list items belong to the previous key
+            if line[0] in ' \t-':
+                if in_requirements and 'SubworkflowFeatureRequirement' in line:
+                    header['subworkflows'] = True
+                continue
+
+            m = TOP_LEVEL_KEY.match(line)
+            if m is None:
+                return None
+            key = m.group(1)
+            value = m.group(2).split(' #')[0].strip()
+
+            if in_requirements and header.get('class') == 'Workflow':
+                # the requirements of the workflow are complete
+                break
+            in_requirements = False
+
+            if key == '$graph':
+                # packed workflow, will be ignored later
+                return {'class': None, 'subworkflows': False}
+            elif key == 'class':
+                header['class'] = value.strip('\'"')
+                if header['class'] != 'Workflow':
+                    break
+            elif key == 'requirements':
+                in_requirements = True
+                header['subworkflows'] = \
+                    'SubworkflowFeatureRequirement' in value
+
+    if 'class' not in header:
+        return None
+    header.setdefault('subworkflows', False)
+    return header
@@ -0,0 +1,98 @@
+"""Sorted listing of the signatures of the steps in a steps library.
+"""
+import bisect
+import fnmatch
+
+# Template of a line in the listing of steps
+LINE_TEMPLATE = u'  {:.<25} {}'
+
+
+class StepListing(object):
+    """Signatures of steps, kept sorted while steps are added and removed.
+
+    The signature of a step (``str(step)``) is only created once, when the
+    step is added. The text returned by ``text()`` is cached until a step is
+    added or removed.
+    """
+    def __init__(self):
+        # step name -> entry (see entries())
+        self.entries_by_name = {}
+        # sorted step names
+        self.names = []
+        # sorted lines of the listing of steps and workflows
+        self.lines = {False: [], True: []}
+        self._text = None
+
+    def add(self, step):
+        """Add a Step to the listing."""
+        self.remove(step.name)
+
+        entry = {'name': step.name,
+                 'python_name': step.python_name,
+                 'is_workflow': step.is_workflow,
+                 'signature': str(step)}
+        self.entries_by_name[step.name] = entry
+        bisect.insort(self.names, step.name)
+        bisect.insort(self.lines[step.is_workflow], _line(entry))
+        self._text = None
+
+    def remove(self, name):
+        """Remove a step from the listing."""
+        entry = self.entries_by_name.pop(name, None)
+        if entry is None:
+            return
+        _remove_sorted(self.names, name)
+        _remove_sorted(self.lines[entry['is_workflow']], _line(entry))
+        self._text = None
+
+    def text(self):
+        """Return the listing of steps and workflows as a string."""
+        if self._text is None:
+            result = [u'Steps\n', u'\n'.join(self.lines[False]),
+                      u'\n\nWorkflows\n', u'\n'.join(self.lines[True])]
+            self._text = u''.join(result)
+        return self._text
+
+    def entries(self, workflows=None, pattern=None, offset=0, limit=None):
+        """Return the signatures of steps, sorted by name.
+
+        Args:
+            workflows (bool, optional): if True, only return workflows, if
+                False, only return steps that are not workflows (default:
+                None, meaning all steps).
+            pattern (str, optional): glob pattern the names of the steps
+                should match (default: None).
+            offset (int, optional): number of matching steps to skip
+                (default: 0).
+            limit (int, optional): maximum number of steps to return
+                (default: None, meaning no maximum).
+
+        Returns:
+            list of dicts containing the ``name``, ``python_name``,
+            ``is_workflow`` and ``signature`` of the steps.
+        """
+        result = []
+        skip = offset
+        for name in self.names:
+            if limit is not None and len(result) >= limit:
+                break
+            entry = self.entries_by_name[name]
+            if workflows is not None and entry['is_workflow'] != workflows:
+                continue
+            if pattern is not None and not fnmatch.fnmatch(name, pattern):
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            result.append(dict(entry))
+        return result
+
+
+def _line(entry):
+    return LINE_TEMPLATE.format(entry['name'], entry['signature'])
+
+
+def _remove_sorted(items, item):
+    i = bisect.bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        del items[i]
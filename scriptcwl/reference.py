@@ -14,6 +14,8 @@ class Reference:
         step_name (str): The name of a step whose output to refer to.
         output_name (str): The name of the output to refer to.
     """
+    __slots__ = ('input_name', 'step_name', 'output_name', 'target_str')
+
     def __init__(self, input_name=None, step_name=None, output_name=None):
         self.input_name = input_name
         self.step_name = step_name
@@ -0,0 +1,165 @@
+"""Fetching CWL files from http(s) urls.
+
+CWL files are fetched concurrently, using one HTTP session with a pool of
+connections. Fetched files can be stored in an on-disk cache (``HTTPCache``),
+together with their ``ETag`` and ``Last-Modified`` headers. Cached files are
+only downloaded again if the server reports they were changed.
+"""
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of urls that are fetched at the same time
+HTTP_WORKERS = 8
+
+# Seconds to wait for a server to respond
+HTTP_TIMEOUT = 30
+
+
+def new_session(pool_size=HTTP_WORKERS):
+    """Return a ``requests`` session that keeps ``pool_size`` connections
+    per host open.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HTTPCache(object):
+    """On-disk cache of files fetched from urls.
+
+    For every url, the contents and the validators (``ETag`` and
+    ``Last-Modified`` headers) of the response are stored, so the file can
+    be fetched with a conditional request.
+
+    Args:
+        cache_dir (str): directory to store the cached files in.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(cache_dir)
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _entry(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, '{}.json'.format(key))
+
+    def get(self, url):
+        """Return the cached response for a url.
+
+        Returns:
+            dict containing the ``url``, ``text``, ``etag`` and
+            ``last_modified`` of the response, or None if the url is not in
+            the cache.
+        """
+        try:
+            with open(self._entry(url)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, url, text, headers):
+        """Add a response to the cache.
+
+        Args:
+            url (str): the url that was fetched.
+            text (str): the contents of the response.
+            headers (dict): the headers of the response.
+        """
+        entry = self._entry(url)
+        response = {'url': url, 'text': text,
+                    'etag': headers.get('ETag'),
+                    'last_modified': headers.get('Last-Modified')}
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(response, f)
+        os.replace(tmp, entry)
+
+    def clear(self):
+        """Remove all responses from the cache."""
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, fname))
+
+
+def fetch_url(url, session, cache=None):
+    """Fetch a url.
+
+    If the url is in the cache, a conditional request is sent, and the
+    cached contents are used if the server responds with ``304 Not
+    Modified``. If the url cannot be fetched, the cached contents are used
+    as well.
+
+    Args:
+        url (str): the url to fetch.
+        session (requests.Session): the session used to fetch the url.
+        cache (HTTPCache, optional): the cache (default: None).
+
+    Returns:
+        tuple (str, None) containing the contents of the url, or (None, str)
+        containing an error message if the url could not be fetched.
+    """
+    import requests
+
+    cached = cache.get(url) if cache is not None else None
+    headers = {}
+    if cached is not None:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        response = session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304 and cached is not None:
+            logger.debug('"{}" not modified'.format(url))
+            return cached['text'], None
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if cached is not None:
+            logger.warning('Error fetching "{}", using cached copy: '
+                           '{}'.format(url, e))
+            return cached['text'], None
+        return None, 'Error fetching "{}": {}'.format(url, e)
+
+    text = response.text
+    if cache is not None:
+        cache.put(url, text, response.headers)
+    return text, None
+
+
+def fetch_urls(urls, cache=None, workers=HTTP_WORKERS):
+    """Fetch urls concurrently.
+
+    Args:
+        urls (list): the urls to fetch.
+        cache (HTTPCache, optional): the cache (default: None).
+        workers (int, optional): the number of urls that are fetched at the
+            same time (default: ``HTTP_WORKERS``).
+
+    Returns:
+        list of (contents, error message) tuples (see ``fetch_url``), in
+        the order of ``urls``.
+    """
+    if not urls:
+        return []
+
+    session = new_session(pool_size=workers)
+    try:
+        if workers > 1 and len(urls) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(
+                    lambda url: fetch_url(url, session, cache=cache), urls))
+        return [fetch_url(url, session, cache=cache) for url in urls]
+    finally:
+        session.close()
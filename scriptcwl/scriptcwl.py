@@ -1,12 +1,17 @@
+import json
 import sys
 import os
 import logging
+import tempfile
 
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
-legacy_cwltool = False
+# Whether an older version of cwltool is installed (determined when cwltool
+# is imported)
+legacy_cwltool = None
+_load_tool = None
 
 
 # Helper function to make the import of cwltool.load_tool quiet
@@ -27,26 +32,62 @@ def quiet():
         sys.stderr = _sys_stderr
 
 
-with quiet():
-    # all is quiet in this scope
-    from cwltool.load_tool import fetch_document
+def import_load_tool():
+    """Return the ``cwltool.load_tool`` module.
 
-    try:
-        from cwltool.load_tool import resolve_and_validate_document
-    except ImportError:
-        from cwltool.load_tool import validate_document
+    Importing cwltool takes a lot of time, so it is only imported when a CWL
+    file is loaded for the first time.
+    """
+    global legacy_cwltool, _load_tool
+
+    if _load_tool is None:
+        with quiet():
+            # all is quiet in this scope
+            from cwltool import load_tool
+
+        legacy_cwltool = not hasattr(load_tool,
+                                     'resolve_and_validate_document')
+        _load_tool = load_tool
+    return _load_tool
+
+
+def new_loading_context():
+    """Return a cwltool loading context that can be shared by ``load_cwl``
+    calls.
+
+    Documents and the HTTP session used for fetching urls are reused by all
+    CWL files loaded with the same loading context. Older versions of cwltool
+    do not support sharing loading contexts, for these versions None is
+    returned.
+    """
+    import_load_tool()
+    if legacy_cwltool:
+        return None
+
+    from cwltool.context import LoadingContext
+    from cwltool.load_tool import default_loader
 
-        legacy_cwltool = True
+    loading_context = LoadingContext()
+    loading_context.loader = default_loader()
+    return loading_context
 
 
-def load_cwl(fname):
+def load_cwl(fname, loading_context=None):
     """Load and validate CWL file using cwltool
+
+    Args:
+        fname (str): path or url of the CWL file.
+        loading_context (LoadingContext, optional): loading context shared
+            with other CWL files (see ``new_loading_context``).
     """
     logger.debug('Loading CWL file "{}"'.format(fname))
+    load_tool = import_load_tool()
+    fetch_document = load_tool.fetch_document
     # Fetching, preprocessing and validating cwl
 
     # Older versions of cwltool
     if legacy_cwltool:
+        validate_document = load_tool.validate_document
         try:
             (document_loader, workflowobj, uri) = fetch_document(fname)
             (document_loader, _, processobj, metadata, uri) = \
@@ -83,9 +124,10 @@ def load_cwl(fname):
                     do_validate=loadingContext.do_validate)
     # Recent versions of cwltool
     else:
-        (loading_context, workflowobj, uri) = fetch_document(fname)
-        loading_context, uri = resolve_and_validate_document(loading_context,
-                                                             workflowobj, uri)
+        (loading_context, workflowobj, uri) = fetch_document(fname,
+                                                             loading_context)
+        loading_context, uri = load_tool.resolve_and_validate_document(
+            loading_context, workflowobj, uri)
         document_loader = loading_context.loader
         processobj = workflowobj
         metadata = loading_context.metadata
@@ -93,5 +135,44 @@ def load_cwl(fname):
     return document_loader, processobj, metadata, uri
 
 
+def load_cwl_obj(obj, uri, loading_context=None):
+    """Validate a CWL document that is in memory using cwltool
+
+    The document is not written to file, but passed to cwltool directly.
+    Older versions of cwltool can only load documents from file, for these
+    versions the document is written to a tmp file (as JSON), which is loaded
+    with ``load_cwl``.
+
+    Args:
+        obj (dict): the CWL document (containing only plain dicts, lists
+            and scalars).
+        uri (str): uri of the document, used to resolve relative references
+            in the document.
+        loading_context (LoadingContext, optional): loading context shared
+            with other CWL files (see ``new_loading_context``).
+    """
+    logger.debug('Loading CWL document "{}"'.format(uri))
+    load_tool = import_load_tool()
+
+    # Older versions of cwltool
+    if legacy_cwltool:
+        (fd, tmpfile) = tempfile.mkstemp(suffix='.cwl')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(obj, f)
+            return load_cwl(tmpfile)
+        finally:
+            os.remove(tmpfile)
+
+    obj = dict(obj)
+    obj['id'] = uri
+    (loading_context, workflowobj, uri) = load_tool.fetch_document(
+        obj, loading_context)
+    loading_context, uri = load_tool.resolve_and_validate_document(
+        loading_context, workflowobj, uri)
+
+    return loading_context.loader, workflowobj, loading_context.metadata, uri
+
+
 def is_url(path):
     return path.startswith('http://') or path.startswith('https://')
@@ -1,4 +1,5 @@
 import os
+import sys
 import copy
 
 import six
@@ -6,23 +7,130 @@ from six.moves.urllib.parse import urlparse
 
 from ruamel.yaml.comments import CommentedMap, CommentedSeq
 
+from .cache import document_hash, file_hash
 from .scriptcwl import load_cwl
+from .trusted import load_cwl_trusted
 from .reference import Reference
 
 
+# Input and output containers of a Tool that are derived from its input table
+# and output types
+VIEWS = ('input_names', 'input_types', 'optional_input_names',
+         'optional_input_types', 'output_names', 'python_names')
+
+
 class PackedWorkflowException(Exception):
     """Error raised when trying to load a packed workflow."""
     pass
 
 
+class Tool(object):
+    """The parts of a Step that are the same for all copies of the step.
+
+    A Tool holds the parsed CWL document, the table of inputs, the output
+    types and the hash of the CWL file. The input and output containers
+    (``input_names``, ``input_types``, ``optional_input_names``,
+    ``optional_input_types``, ``output_names`` and ``python_names``) are
+    derived from the input table and the output types when one of them is
+    used for the first time, so steps in the steps library that are never
+    added to a workflow do not need them.
+    """
+    __slots__ = ('command_line_tool', 'is_workflow', 'input_table',
+                 'output_types', 'sha256') + VIEWS
+
+    def view(self, name):
+        """Return one of the derived input and output containers."""
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            self._derive_views()
+            return getattr(self, name)
+
+    def _derive_views(self):
+        """Create the input and output containers from ``input_table`` and
+        ``output_types``."""
+        table = self.input_table
+        self.input_names = [n for n, _, optional in table if not optional]
+        self.input_types = dict([(n, t) for n, t, optional in table
+                                 if not optional])
+        self.optional_input_names = [n for n, _, optional in table
+                                     if optional]
+        self.optional_input_types = dict([(n, t) for n, t, optional in table
+                                          if optional])
+        self.output_names = list(self.output_types.keys())
+        names = [n for n, _, _ in table] + self.output_names
+        self.python_names = dict([(python_name(n), n) for n in names])
+
+    def reset_views(self):
+        """Forget the derived containers, after the input table changed."""
+        for name in VIEWS:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
+
+def _tool_attribute(name):
+    """Return a property for an attribute of the Tool of a Step.
+
+    Setting the attribute changes a copy of the Tool, because the Tool is
+    shared with the other copies of the Step.
+    """
+    if name in VIEWS:
+        def fget(self):
+            return self.tool.view(name)
+    else:
+        def fget(self):
+            return getattr(self.tool, name)
+
+    def fset(self, value):
+        if name in VIEWS:
+            # derive the other containers before one of them is replaced
+            self.tool.view(name)
+        tool = copy.copy(self.tool)
+        if name == 'input_table':
+            tool.reset_views()
+        setattr(tool, name, value)
+        self.tool = tool
+
+    return property(fget, fset)
+
+
 class Step(object):
     """Representation of a CWL step.
 
     The Step can be a CommandLineTool or a Workflow. Steps are read from file
-    and validated using ``cwltool``.
+    and validated using ``cwltool``. When loading many steps, a cwltool
+    ``loading_context`` can be shared between them.
+
+    Local CWL files that are known to be valid can be loaded without
+    validating them, by setting ``trusted`` to True (see
+    ``scriptcwl.trusted``). The resulting Step has the same inputs and
+    outputs, but ``command_line_tool`` contains the document as it was read
+    (with preprocessed inputs and outputs) instead of the document as it was
+    processed by cwltool.
+
+    The inputs of the step are stored in a single table of
+    ``(name, type, optional)`` tuples. The table, the parsed document and the
+    containers derived from them are stored in a ``Tool`` that is shared by
+    all copies of the step.
     """
-
-    def __init__(self, fname):
+    __slots__ = ('run', 'from_url', 'name', 'python_name', 'tool',
+                 'output_types', 'step_inputs', 'is_scattered',
+                 'scattered_inputs', 'scatter_method', 'name_in_workflow')
+
+    command_line_tool = _tool_attribute('command_line_tool')
+    is_workflow = _tool_attribute('is_workflow')
+    input_table = _tool_attribute('input_table')
+    sha256 = _tool_attribute('sha256')
+    input_names = _tool_attribute('input_names')
+    input_types = _tool_attribute('input_types')
+    optional_input_names = _tool_attribute('optional_input_names')
+    optional_input_types = _tool_attribute('optional_input_types')
+    output_names = _tool_attribute('output_names')
+    python_names = _tool_attribute('python_names')
+
+    def __init__(self, fname, loading_context=None, trusted=False):
         fname = str(fname)
         if fname.startswith('http://') or fname.startswith('https://'):
             self.run = fname
@@ -31,47 +139,47 @@ class Step(object):
             self.run = os.path.abspath(fname)
             self.from_url = False
 
-        bn = os.path.basename(fname)
-        self.name = os.path.splitext(bn)[0]
+        self.name = step_name(fname)
         self.python_name = python_name(self.name)
 
         self.step_inputs = {}
-        self.input_names = []
-        self.input_types = {}
-        self.optional_input_names = []
-        self.optional_input_types = {}
-        self.output_names = []
-        self.output_types = {}
-        self.is_workflow = False
         self.is_scattered = False
         self.scattered_inputs = []
-        self.python_names = {}
-
-        document_loader, processobj, metadata, uri = load_cwl(fname)
-        s = processobj
 
-        self.command_line_tool = s
+        s = None
+        if trusted and not self.from_url:
+            s = load_cwl_trusted(fname)
+        if s is None:
+            document_loader, processobj, metadata, uri = load_cwl(
+                fname, loading_context=loading_context)
+            s = processobj
+
+        tool = Tool()
+        tool.command_line_tool = s
+        # the hash of the CWL file identifies the tool (see
+        # scriptcwl.validation)
+        if self.from_url:
+            tool.sha256 = document_hash(s)
+        else:
+            tool.sha256 = file_hash(fname)
+        tool.is_workflow = False
+        tool.input_table = ()
+        tool.output_types = {}
         valid_classes = ('CommandLineTool', 'Workflow', 'ExpressionTool')
         if 'class' in s and s['class'] in valid_classes:
-            self.is_workflow = s['class'] == 'Workflow'
+            tool.is_workflow = s['class'] == 'Workflow'
+            input_table = []
             for inp in s['inputs']:
                 # Due to preprocessing of cwltool the id has become an
                 # absolute iri, for ease of use we keep only the fragment
-                short_id = iri2fragment(inp['id'])
-                if self._input_optional(inp):
-                    self.optional_input_names.append(short_id)
-                    self.optional_input_types[short_id] = inp['type']
-                    self.python_names[python_name(short_id)] = short_id
-                else:
-                    self.input_names.append(short_id)
-                    self.input_types[short_id] = inp['type']
-                    self.python_names[python_name(short_id)] = short_id
+                short_id = intern(iri2fragment(inp['id']))
+                input_table.append((short_id, intern(inp['type']),
+                                    self._input_optional(inp)))
+            tool.input_table = tuple(input_table)
 
             for o in s['outputs']:
-                short_id = iri2fragment(o['id'])
-                self.output_names.append(short_id)
-                self.output_types[short_id] = o['type']
-                self.python_names[python_name(short_id)] = short_id
+                short_id = intern(iri2fragment(o['id']))
+                tool.output_types[short_id] = intern(o['type'])
         else:
             if isinstance(s, CommentedSeq):
                 msg = 'Not loading "{}", because it is a packed workflow.'
@@ -79,6 +187,25 @@ class Step(object):
             else:
                 msg = '"{}" is a unsupported'
                 raise NotImplementedError(msg.format(self.name))
+        self.tool = tool
+        self.output_types = tool.output_types
+
+    def copy(self):
+        """Return a copy of the Step that can be added to a workflow.
+
+        The Tool (the parsed CWL document and the input definitions) is
+        shared with the original Step. Only the state that changes when a
+        step is added to a workflow (the step inputs, scattering and output
+        types) is copied.
+
+        Returns:
+            Step
+        """
+        s = copy.copy(self)
+        s.step_inputs = copy.copy(self.step_inputs)
+        s.scattered_inputs = list(self.scattered_inputs)
+        s.output_types = copy.deepcopy(self.output_types)
+        return s
 
     def get_input_names(self):
         """Return the Step's input names (including optional input names).
@@ -225,7 +352,9 @@ class Step(object):
         else:
             obj['run'] = self.run
         obj['in'] = self.step_inputs
-        obj['out'] = self.output_names
+        # output_names is shared by all copies of the step, a new list
+        # prevents YAML aliases when the step is added multiple times
+        obj['out'] = list(self.output_names)
         if self.is_scattered:
             obj['scatter'] = self.scattered_inputs
             # scatter_method is optional when scattering over a single variable
@@ -235,13 +364,17 @@ class Step(object):
         return obj
 
     def __str__(self):
-        if self.optional_input_names:
+        # Uses the input table, so listing the steps in the steps library
+        # does not derive the input and output containers of every step
+        in_names = [python_name(n) for n, _, optional in self.input_table
+                    if not optional]
+        opt_in_names = [python_name(n) for n, _, optional in self.input_table
+                        if optional]
+        out_names = [python_name(n) for n in self.output_types]
+        if opt_in_names:
             template = u'{} = wf.{}({}[, {}])'
         else:
             template = u'{} = wf.{}({})'
-        out_names = [python_name(n) for n in self.output_names]
-        in_names = [python_name(n) for n in self.input_names]
-        opt_in_names = [python_name(n) for n in self.optional_input_names]
         return template.format(u', '.join(out_names), self.python_name,
                                u', '.join(in_names), u', '.join(
                                    opt_in_names))
@@ -279,6 +412,29 @@ def iri2fragment(iri):
     return o.fragment
 
 
+def intern(value):
+    """Intern strings, so equal names and types share memory.
+
+    Other values are returned unchanged.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def step_name(fname):
+    """Return the name of the step in a CWL file.
+
+    Args:
+        fname (str): path or url of the CWL file.
+
+    Returns:
+        str: the file name without extension.
+    """
+    bn = os.path.basename(fname)
+    return os.path.splitext(bn)[0]
+
+
 def python_name(name):
     """Transform cwl step name into a python method name.
 
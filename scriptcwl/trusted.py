@@ -0,0 +1,131 @@
+"""Loading CWL files without validating them with cwltool.
+
+If the CWL files are known to be valid (e.g., because they were validated
+in CI), validating them again with cwltool is wasted time. The trusted loader
+reads a CWL file with a fast YAML loader (backed by libyaml, if it is
+available) and applies the parts of cwltool's preprocessing that are needed
+to create a ``Step``: inputs and outputs are converted to lists with absolute
+ids, and the type shortcuts (``type?``, ``type[]``, ``stdout`` and ``stderr``)
+are expanded.
+
+Documents that use features the trusted loader does not support (e.g.,
+``$import``, custom types, records, enums and a top-level ``id``) are loaded
+with cwltool instead.
+"""
+import os
+
+import six
+from six.moves.urllib.parse import urljoin
+from six.moves.urllib.request import pathname2url
+
+from ruamel import yaml
+
+# Types that are not changed by cwltool's preprocessing
+PRIMITIVE_TYPES = frozenset(['null', 'boolean', 'int', 'long', 'float',
+                             'double', 'string', 'File', 'Directory', 'Any'])
+
+# Classes of CWL processes that can be loaded
+PROCESS_CLASSES = frozenset(['CommandLineTool', 'Workflow', 'ExpressionTool'])
+
+
+class UnsupportedDocument(Exception):
+    """Error raised when a CWL file cannot be loaded by the trusted loader."""
+    pass
+
+
+def load_cwl_trusted(fname):
+    """Load a CWL file without validating it.
+
+    Args:
+        fname (str): path of the CWL file.
+
+    Returns:
+        dict: the preprocessed CWL document, or None if the file cannot be
+        loaded by the trusted loader (and should be loaded with cwltool,
+        which also reports missing and unreadable files).
+    """
+    try:
+        with open(fname) as f:
+            obj = yaml.YAML(typ='safe').load(f)
+        return preprocess(obj, file_uri(fname))
+    except (UnsupportedDocument, yaml.YAMLError, IOError, OSError,
+            UnicodeDecodeError):
+        return None
+
+
+def file_uri(fname):
+    """Return the file uri of a path."""
+    return urljoin('file:', pathname2url(os.path.abspath(fname)))
+
+
+def preprocess(obj, uri):
+    """Apply the preprocessing of cwltool to the inputs and outputs of a
+    CWL document.
+
+    Raises:
+        UnsupportedDocument: The document cannot be preprocessed.
+    """
+    if not isinstance(obj, dict) or obj.get('class') not in PROCESS_CLASSES:
+        raise UnsupportedDocument()
+    if not str(obj.get('cwlVersion', '')).startswith('v1.'):
+        raise UnsupportedDocument()
+    if 'id' in obj:
+        # cwltool resolves the ids of the inputs and outputs relative to the
+        # id of the document
+        raise UnsupportedDocument()
+
+    obj['id'] = uri
+    obj['inputs'] = _normalize_parameters(obj.get('inputs', []), uri)
+    obj['outputs'] = _normalize_parameters(obj.get('outputs', []), uri)
+    return obj
+
+
+def _normalize_parameters(params, uri):
+    if isinstance(params, dict):
+        # map form: {id: type} or {id: {type: ..., ...}}; like cwltool
+        # (schema-salad), the parameters are sorted by id
+        normalized = []
+        for short_id, param in sorted(params.items()):
+            if not isinstance(param, dict):
+                param = {'type': param}
+            param = dict(param)
+            param['id'] = short_id
+            normalized.append(param)
+        params = normalized
+    elif isinstance(params, list):
+        params = [dict(p) for p in params]
+    else:
+        raise UnsupportedDocument()
+
+    for param in params:
+        if any(k.startswith('$') for k in param.keys()) or \
+                'type' not in param or 'id' not in param:
+            raise UnsupportedDocument()
+        param['id'] = '{}#{}'.format(uri, str(param['id']).lstrip('#'))
+        param['type'] = normalize_type(param['type'])
+    return params
+
+
+def normalize_type(typ):
+    """Expand the type shortcuts in a CWL type.
+
+    Raises:
+        UnsupportedDocument: The type is not supported by the trusted loader.
+    """
+    if isinstance(typ, six.string_types):
+        if typ.endswith('?'):
+            return ['null', normalize_type(typ[:-1])]
+        if typ.endswith('[]'):
+            return {'type': 'array', 'items': normalize_type(typ[:-2])}
+        if typ in ('stdout', 'stderr'):
+            return 'File'
+        if typ in PRIMITIVE_TYPES:
+            return typ
+    elif isinstance(typ, list):
+        return [normalize_type(t) for t in typ]
+    elif isinstance(typ, dict) and typ.get('type') == 'array' and \
+            'items' in typ:
+        typ = dict(typ)
+        typ['items'] = normalize_type(typ['items'])
+        return typ
+    raise UnsupportedDocument()
@@ -0,0 +1,121 @@
+"""Index of steps by the types of their inputs and outputs.
+"""
+import six
+
+
+def type_keys(typ):
+    """Return the normalized names of a CWL type.
+
+    Optional types are indexed as the type itself (``File?`` and
+    ``['null', 'File']`` become ``File``), arrays get the suffix ``[]``
+    (``{'type': 'array', 'items': 'File'}`` becomes ``File[]``), and union
+    types are indexed as each of their members. Enums and records are
+    indexed by their name (or ``enum`` and ``record``, if they are
+    anonymous).
+
+    Args:
+        typ: a CWL type (a string, list or dict).
+
+    Returns:
+        list of str.
+    """
+    if isinstance(typ, six.string_types):
+        if typ.endswith('?'):
+            return type_keys(typ[:-1])
+        return [typ]
+    elif isinstance(typ, list):
+        keys = []
+        for t in typ:
+            if t != 'null':
+                keys += [k for k in type_keys(t) if k not in keys]
+        return keys
+    elif isinstance(typ, dict):
+        if typ.get('type') == 'array':
+            return ['{}[]'.format(k) for k in type_keys(typ.get('items'))]
+        name = typ.get('name')
+        if isinstance(name, six.string_types):
+            # names of custom types are iris
+            return [name.split('#')[-1]]
+        return type_keys(typ.get('type'))
+    return []
+
+
+class TypeIndex(object):
+    """Inverted index from the types of inputs and outputs to steps.
+
+    Steps are added to and removed from the index one by one, so the index
+    can be kept up to date while steps are loaded.
+    """
+    def __init__(self):
+        # type -> {step name: True if the input is optional}
+        self.consumers = {}
+        # type -> set of step names
+        self.producers = {}
+        # step name -> (input types, output types)
+        self.step_types = {}
+
+    def add(self, step):
+        """Add a Step to the index."""
+        self.remove(step.name)
+
+        in_types = set()
+        for _, typ, optional in step.input_table:
+            for k in type_keys(typ):
+                consumers = self.consumers.setdefault(k, {})
+                # a step consumes a type if any input of that type is
+                # required
+                consumers[step.name] = consumers.get(step.name, True) and \
+                    optional
+                in_types.add(k)
+
+        out_types = set()
+        for typ in step.output_types.values():
+            for k in type_keys(typ):
+                self.producers.setdefault(k, set()).add(step.name)
+                out_types.add(k)
+
+        self.step_types[step.name] = (in_types, out_types)
+
+    def remove(self, name):
+        """Remove a step from the index."""
+        in_types, out_types = self.step_types.pop(name, ((), ()))
+        for k in in_types:
+            del self.consumers[k][name]
+            if not self.consumers[k]:
+                del self.consumers[k]
+        for k in out_types:
+            self.producers[k].discard(name)
+            if not self.producers[k]:
+                del self.producers[k]
+
+    def consuming(self, typ, optional=True):
+        """Return the names of the steps with an input of the given type.
+
+        Args:
+            typ: a CWL type, e.g., ``'File[]'``.
+            optional (bool): whether to include steps for which inputs of
+                this type are optional (default: True).
+
+        Returns:
+            sorted list of step names.
+        """
+        names = set()
+        for k in type_keys(typ):
+            for name, opt in self.consumers.get(k, {}).items():
+                if optional or not opt:
+                    names.add(name)
+        return sorted(names)
+
+    def producing(self, typ):
+        """Return the names of the steps with an output of the given type.
+
+        Args:
+            typ: a CWL type, e.g., ``'Directory'``.
+
+        Returns:
+            sorted list of step names.
+        """
+        names = set()
+        for k in type_keys(typ):
+            names.update(self.producers.get(k, ()))
+        return sorted(names)
@@ -0,0 +1,317 @@
+"""Incremental and structural validation of workflows.
+
+Validating a workflow with cwltool means validating every step it refers to
+again, although the steps in the steps library were already validated when
+they were loaded. ``ValidationState`` remembers what the workflow looked like
+when it was last validated. After that, only the workflow inputs, steps and
+workflow outputs that were added or changed are checked: the sources of
+their inputs must exist (and precede the step), required inputs must be
+connected, scatter variables must be inputs of the step and the
+requirements that are needed must be declared. The steps themselves are
+trusted.
+
+Changes that cannot be checked this way (e.g., removed steps, steps of which
+the tool was replaced or changed workflow inputs) make the workflow be
+validated completely with cwltool again.
+
+``check_workflow`` applies the same checks to all steps of a workflow, and
+checks that the steps do not form a cycle, without using cwltool at all.
+"""
+import six
+
+from .trusted import UnsupportedDocument, normalize_type
+from .yamlutils import to_plain
+
+# Valid values of the scatterMethod of a step (None if the step is not
+# scattered, or scattered over a single variable)
+SCATTER_METHODS = (None, 'dotproduct', 'nested_crossproduct',
+                   'flat_crossproduct')
+
+
+def validation_error(msg):
+    """Return the exception cwltool raises for invalid documents."""
+    try:
+        from schema_salad.exceptions import ValidationException
+    except ImportError:
+        # Older versions of schema-salad
+        from schema_salad.validate import ValidationException
+    return ValidationException(msg)
+
+
+def step_fingerprint(step):
+    """Return a hashable summary of the parts of a step in a workflow that
+    are checked when validating it.
+
+    The first two items (the ``run`` path or url and the hash of the CWL
+    file) identify the tool of the step.
+    """
+    inputs = []
+    for name, source in sorted(step.step_inputs.items()):
+        if isinstance(source, list):
+            source = tuple(six.text_type(s) for s in source)
+        else:
+            source = six.text_type(source)
+        inputs.append((name, source))
+    return (step.run, step.sha256, tuple(inputs),
+            tuple(step.scattered_inputs),
+            getattr(step, 'scatter_method', None))
+
+
+def sources(source):
+    """Return the names of the sources of a step input as a list."""
+    if isinstance(source, list):
+        return [six.text_type(s) for s in source]
+    return [six.text_type(source)]
+
+
+class ValidationState(object):
+    """The parts of a workflow as they were when it was last validated."""
+    def __init__(self):
+        self.inputs = None
+        self.outputs = None
+        self.steps = None
+
+    def reset(self):
+        """Forget the last validation."""
+        self.inputs = None
+        self.outputs = None
+        self.steps = None
+
+    def record(self, wf, steps=None):
+        """Remember the workflow as it is now, after validating it.
+
+        Args:
+            wf (WorkflowGenerator): the validated workflow.
+            steps (dict, optional): the fingerprints of the steps of the
+                workflow, if they were already computed.
+        """
+        if steps is None:
+            steps = dict([(name, step_fingerprint(step))
+                          for name, step in wf.wf_steps.items()])
+        self.inputs = to_plain(wf.wf_inputs)
+        self.outputs = to_plain(wf.wf_outputs)
+        self.steps = steps
+
+    def validate(self, wf):
+        """Check the parts of the workflow that changed since the last
+        validation.
+
+        Returns:
+            bool: True if the changes were checked, False if the workflow
+            should be validated completely.
+
+        Raises:
+            ValidationException: The workflow is invalid.
+        """
+        if self.steps is None:
+            return False
+
+        inputs = to_plain(wf.wf_inputs)
+        for name, typ in self.inputs.items():
+            if inputs.get(name) != typ:
+                # changed or removed workflow input
+                return False
+        for name, typ in inputs.items():
+            if name not in self.inputs and not _valid_input(typ):
+                return False
+
+        steps = {}
+        positions = {}
+        changed = []
+        for i, (name, step) in enumerate(wf.wf_steps.items()):
+            steps[name] = fingerprint = step_fingerprint(step)
+            positions[name] = i
+            previous = self.steps.get(name)
+            if previous != fingerprint:
+                if previous is not None and previous[:2] != fingerprint[:2]:
+                    # the tool of the step was replaced, so steps and
+                    # workflow outputs using its outputs must be checked
+                    # again
+                    return False
+                changed.append(name)
+        if any(name not in steps for name in self.steps):
+            # removed step
+            return False
+
+        for name in changed:
+            upstream = check_step(wf, name)
+            if any(positions[u] >= positions[name] for u in upstream):
+                # the step may be part of a cycle
+                return False
+
+        outputs = to_plain(wf.wf_outputs)
+        for name, output in outputs.items():
+            if self.outputs.get(name) != output:
+                _check_output(wf, name, output)
+
+        self.inputs = inputs
+        self.outputs = outputs
+        self.steps = steps
+        return True
+
+
+def _valid_input(typ):
+    if isinstance(typ, dict):
+        if 'type' not in typ:
+            return False
+        typ = typ['type']
+    try:
+        normalize_type(typ)
+    except UnsupportedDocument:
+        return False
+    return True
+
+
+def _check_source(wf, source):
+    """Check that a source exists.
+
+    Returns:
+        str: the name of the step the source refers to, or None if the
+        source is a workflow input.
+    """
+    if '/' not in source:
+        if source not in wf.wf_inputs:
+            msg = 'Source "{}" is not a workflow input or step output.'
+            raise validation_error(msg.format(source))
+        return None
+
+    step_name, output_name = source.split('/', 1)
+    if step_name not in wf.wf_steps:
+        msg = 'Source "{}" refers to step "{}", which is not in the workflow.'
+        raise validation_error(msg.format(source, step_name))
+    if output_name not in wf.wf_steps[step_name].output_types:
+        msg = 'Step "{}" has no output "{}".'
+        raise validation_error(msg.format(step_name, output_name))
+    return step_name
+
+
+def check_step(wf, name):
+    """Check the wiring of a step in a workflow.
+
+    Returns:
+        set: the names of the steps the step gets its inputs from.
+
+    Raises:
+        ValidationException: The wiring of the step is invalid.
+    """
+    step = wf.wf_steps[name]
+    input_names = step.get_input_names()
+    upstream = set()
+
+    for input_name, source in step.step_inputs.items():
+        if input_name not in input_names:
+            msg = 'Step "{}" has no input "{}".'
+            raise validation_error(msg.format(name, input_name))
+        if isinstance(source, list) and not wf.has_multiple_inputs:
+            msg = 'Input "{}" of step "{}" has multiple sources, but ' \
+                  'MultipleInputFeatureRequirement is not declared.'
+            raise validation_error(msg.format(input_name, name))
+        for s in sources(source):
+            step_name = _check_source(wf, s)
+            if step_name is not None:
+                upstream.add(step_name)
+            input_type = wf._get_input_type(step, input_name)
+            if isinstance(source, list):
+                input_type = input_type['items']
+            source_type = _source_type(wf, s)
+            if not wf._types_match(source_type, input_type):
+                msg = 'Source "{}" of type "{}" is not compatible with ' \
+                      'input "{}" of step "{}" of type "{}".'
+                raise validation_error(msg.format(s, source_type, input_name,
+                                                  name, input_type))
+
+    for input_name in step.input_names:
+        if input_name not in step.step_inputs:
+            msg = 'Required input "{}" of step "{}" is not connected.'
+            raise validation_error(msg.format(input_name, name))
+
+    for var in step.scattered_inputs:
+        if var not in input_names:
+            msg = 'Invalid variable "{}" for scatter in step "{}".'
+            raise validation_error(msg.format(var, name))
+    if step.scattered_inputs and not wf.has_scatter_requirement:
+        msg = 'Step "{}" is scattered, but ScatterFeatureRequirement is ' \
+              'not declared.'
+        raise validation_error(msg.format(name))
+    if len(step.scattered_inputs) > 1 and \
+            not getattr(step, 'scatter_method', None):
+        msg = 'Step "{}" has multiple scatter variables, but no scatter ' \
+              'method.'
+        raise validation_error(msg.format(name))
+    if getattr(step, 'scatter_method', None) not in SCATTER_METHODS:
+        msg = 'Invalid scatterMethod "{}" in step "{}".'
+        raise validation_error(msg.format(step.scatter_method, name))
+
+    if step.is_workflow and not wf.has_workflow_step:
+        msg = 'Step "{}" is a workflow, but SubworkflowFeatureRequirement ' \
+              'is not declared.'
+        raise validation_error(msg.format(name))
+    return upstream
+
+
+def _source_type(wf, source):
+    if '/' in source:
+        step_name, output_name = source.split('/', 1)
+        return wf.wf_steps[step_name].output_types[output_name]
+    input_def = wf.wf_inputs[source]
+    if isinstance(input_def, dict):
+        return input_def['type']
+    return input_def
+
+
+def _check_output(wf, name, output):
+    source = output.get('outputSource')
+    if not isinstance(source, six.string_types) or '/' not in source:
+        msg = 'Workflow output "{}" has no valid outputSource.'
+        raise validation_error(msg.format(name))
+    step_name, output_name = source.split('/', 1)
+    if step_name not in wf.wf_steps or \
+            output_name not in wf.wf_steps[step_name].output_types:
+        msg = 'Output source "{}" of workflow output "{}" does not exist.'
+        raise validation_error(msg.format(source, name))
+
+
+def check_workflow(wf):
+    """Check the structure of a workflow without using cwltool.
+
+    The wiring of every step is checked (see ``check_step``), the steps must
+    not form a cycle and the sources of the workflow outputs must exist. The
+    steps themselves are trusted. The time needed is linear in the number of
+    steps and connections between them.
+
+    Raises:
+        ValidationException: The workflow is invalid.
+    """
+    upstream = {}
+    for name in wf.wf_steps:
+        upstream[name] = check_step(wf, name)
+    _check_acyclic(upstream)
+
+    for name, output in wf.wf_outputs.items():
+        _check_output(wf, name, to_plain(output))
+
+
+def _check_acyclic(upstream):
+    """Check that the step graph has no cycles (using Kahn's algorithm)."""
+    downstream = dict([(name, []) for name in upstream])
+    waiting = {}
+    for name, step_names in upstream.items():
+        waiting[name] = len(step_names)
+        for step_name in step_names:
+            downstream[step_name].append(name)
+
+    ready = [name for name, n in waiting.items() if n == 0]
+    done = 0
+    while ready:
+        name = ready.pop()
+        done += 1
+        for step_name in downstream[name]:
+            waiting[step_name] -= 1
+            if waiting[step_name] == 0:
+                ready.append(step_name)
+
+    if done < len(upstream):
+        in_cycle = sorted([name for name, n in waiting.items() if n > 0])
+        msg = 'The workflow contains a cycle. Steps in or after the cycle: ' \
+              '{}.'
+        raise validation_error(msg.format(', '.join(in_cycle)))
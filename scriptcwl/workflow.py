@@ -1,28 +1,22 @@
 from __future__ import print_function
 
 import codecs
-import copy
 import os
-import shutil
 from functools import partial
 
-import tempfile
 import six
 from ruamel.yaml.comments import CommentedMap
 
-from .scriptcwl import load_cwl, quiet
+from .scriptcwl import load_cwl_obj, quiet
 from .step import python_name
-from .yamlutils import save_yaml, yaml2string
-from .library import StepsLibrary
+from .validation import ValidationState, check_workflow
+from .trusted import file_uri
+from .yamlutils import EMITTERS, save_yaml, to_plain, yaml2string
+from .library import StepsLibrary, stage_file
 from .reference import Reference
 
 import warnings
 
-# import cwltool.load_tool functions
-with quiet():
-    # all is quiet in this scope
-    from cwltool.main import print_pack
-
 warnings.simplefilter('always', DeprecationWarning)
 
 
@@ -103,9 +97,36 @@ class WorkflowGenerator(object):
     ::
 
         wf.list_steps()
+
+    To create many workflows from the same steps, load the steps once into a
+    ``StepsLibrary`` and pass it to every WorkflowGenerator. The steps are
+    not validated again, and the options for loading steps (``workers``,
+    ``cache_dir``, ``lazy``, ``staging`` and ``trusted``) are ignored:
+    ::
+
+        from scriptcwl.library import StepsLibrary
+
+        lib = StepsLibrary()
+        lib.load(steps_dir='/path/to/dir/with/cwl/steps/')
+        lib.freeze()
+
+        with WorkflowGenerator(library=lib) as wf:
+            ...
     """
 
-    def __init__(self, steps_dir=None, working_dir=None):
+    def __init__(self, steps_dir=None, working_dir=None, workers=None,
+                 cache_dir=None, lazy=False, library=None,
+                 staging='changed', trusted=False):
+        if library is not None:
+            if working_dir is None:
+                working_dir = library.working_dir
+            elif library.working_dir is None or \
+                    os.path.abspath(working_dir) != \
+                    os.path.abspath(library.working_dir):
+                msg = 'The working directory "{}" is not the working ' \
+                      'directory of the steps library.'.format(working_dir)
+                raise ValueError(msg)
+
         self.working_dir = working_dir
         if self.working_dir:
             self.working_dir = os.path.abspath(self.working_dir)
@@ -115,14 +136,27 @@ class WorkflowGenerator(object):
         self.wf_inputs = CommentedMap()
         self.wf_outputs = CommentedMap()
         self.step_output_types = {}
-        self.steps_library = StepsLibrary(working_dir=working_dir)
+        if library is None:
+            library = StepsLibrary(working_dir=working_dir, workers=workers,
+                                   cache_dir=cache_dir, lazy=lazy,
+                                   staging=staging, trusted=trusted)
+        self.steps_library = library
         self.has_workflow_step = False
         self.has_scatter_requirement = False
         self.has_multiple_inputs = False
 
+        # The step ids used in this workflow and the next number to try for
+        # each step name, for generating unique step names
+        self._step_ids = set()
+        self._step_name_counters = {}
+
+        # What the workflow looked like when it was last validated
+        self._validation = ValidationState()
+
         self._wf_closed = False
 
-        self.load(steps_dir)
+        if steps_dir is not None:
+            self.load(steps_dir)
 
     def __enter__(self):
         self._wf_closed = False
@@ -135,6 +169,9 @@ class WorkflowGenerator(object):
         self.wf_outputs = None
         self.step_output_types = None
         self.steps_library = None
+        self._step_ids = None
+        self._step_name_counters = None
+        self._validation = None
         self.has_workflow_step = None
         self.has_scatter_requirement = None
         self.working_dir = None
@@ -157,7 +194,9 @@ class WorkflowGenerator(object):
         if self._wf_closed:
             raise ValueError('Operation on closed WorkflowGenerator.')
 
-    def load(self, steps_dir=None, step_file=None, step_list=None):
+    def load(self, steps_dir=None, step_file=None, step_list=None,
+             workers=None, bundle=None, recursive=False, include=None,
+             exclude=None):
         """Load CWL steps into the WorkflowGenerator's steps library.
 
         Adds steps (command line tools and workflows) to the
@@ -169,11 +208,41 @@ class WorkflowGenerator(object):
                 the directory are loaded.
             step_file (str): path to a file containing a CWL step that will be
                 added to the steps library.
+            step_list (list): list of directories, urls or local file paths
+                to CWL files or directories containing CWL files.
+            workers (int): number of processes used to validate the CWL
+                files (default: the number of workers the
+                ``WorkflowGenerator`` was created with).
+            bundle (str): path to a bundle of steps (see
+                ``scriptcwl.bundle.create_bundle``).
+            recursive (bool): whether to load the CWL files in
+                subdirectories of the directories (default: False).
+                Hidden directories and directories with vendored code (e.g.,
+                ``node_modules``) are skipped.
+            include (list): glob patterns of the files to load from the
+                directories (default: ``['*.cwl']``).
+            exclude (list): glob patterns of files and directories to skip.
         """
         self._closed()
 
         self.steps_library.load(steps_dir=steps_dir, step_file=step_file,
-                                step_list=step_list)
+                                step_list=step_list, workers=workers,
+                                bundle=bundle, recursive=recursive,
+                                include=include, exclude=exclude)
+
+    def refresh(self):
+        """Reload CWL steps that were added, modified or deleted.
+
+        Checks the directories and files loaded into the steps library for
+        changes, and updates the steps library accordingly.
+
+        Returns:
+            dict containing the names of the steps that were ``added``,
+            ``modified`` and ``deleted``.
+        """
+        self._closed()
+
+        return self.steps_library.refresh()
 
     def list_steps(self):
         """Return string with the signature of all steps in the steps library.
@@ -182,6 +251,21 @@ class WorkflowGenerator(object):
 
         return self.steps_library.list_steps()
 
+    def step_signatures(self, workflows=None, pattern=None, offset=0,
+                        limit=None):
+        """Return the signatures of the steps in the steps library.
+
+        See ``StepsLibrary.step_signatures``.
+
+        Returns:
+            list of dicts containing the ``name``, ``python_name``,
+            ``is_workflow`` and ``signature`` of the steps.
+        """
+        self._closed()
+
+        return self.steps_library.step_signatures(
+            workflows=workflows, pattern=pattern, offset=offset, limit=limit)
+
     def _has_requirements(self):
         """Returns True if the workflow needs a requirements section.
 
@@ -342,13 +426,14 @@ class WorkflowGenerator(object):
     def _get_step(self, name, make_copy=True):
         """Return step from steps library.
 
-        Optionally, the step returned is a deep copy from the step in the steps
+        Optionally, the step returned is a copy of the step in the steps
         library, so additional information (e.g., about whether the step was
-        scattered) can be stored in the copy.
+        scattered) can be stored in the copy. The copy shares the parsed CWL
+        document with the step in the steps library.
 
         Args:
             name (str): name of the step in the steps library.
-            make_copy (bool): whether a deep copy of the step should be
+            make_copy (bool): whether a copy of the step should be
                 returned or not (default: True).
 
         Returns:
@@ -366,24 +451,32 @@ class WorkflowGenerator(object):
                   'spelling or load additional steps'
             raise ValueError(msg.format(name))
         if make_copy:
-            s = copy.deepcopy(s)
+            s = s.copy()
         return s
 
     def _generate_step_name(self, step_name):
         name = step_name
-        i = 1
+        i = self._step_name_counters.get(step_name, 1)
+        if i > 1:
+            name = '{}-{}'.format(step_name, i - 1)
 
-        while name in self.steps_library.step_ids:
+        while name in self._step_ids:
             name = '{}-{}'.format(step_name, i)
             i += 1
+        self._step_name_counters[step_name] = i
 
         return name
 
-    def to_obj(self, wd=False, pack=False, relpath=None):
+    def to_obj(self, wd=False, pack=False, relpath=None, include_steps=True):
         """Return the created workflow as a dict.
 
         The dict can be written to a yaml file.
 
+        Args:
+            include_steps (bool): whether to include the ``steps`` of the
+                workflow (default: True). To save large workflows, the steps
+                are added one by one (see ``iter_steps_obj``).
+
         Returns:
             A yaml-compatible dict representing the workflow.
         """
@@ -413,15 +506,27 @@ class WorkflowGenerator(object):
         obj['inputs'] = self.wf_inputs
         obj['outputs'] = self.wf_outputs
 
-        steps_obj = CommentedMap()
-        for key in self.wf_steps:
-            steps_obj[key] = self.wf_steps[key].to_obj(relpath=relpath,
-                                                       pack=pack,
-                                                       wd=wd)
-        obj['steps'] = steps_obj
+        if include_steps:
+            steps_obj = CommentedMap()
+            for key, step_obj in self.iter_steps_obj(wd=wd, pack=pack,
+                                                     relpath=relpath):
+                steps_obj[key] = step_obj
+            obj['steps'] = steps_obj
 
         return obj
 
+    def iter_steps_obj(self, wd=False, pack=False, relpath=None):
+        """Generate the steps of the workflow as (name, dict) tuples.
+
+        The dicts are created one at a time, so a large workflow can be
+        written to file without creating the dicts for all steps first.
+        """
+        self._closed()
+
+        for key in self.wf_steps:
+            yield key, self.wf_steps[key].to_obj(relpath=relpath, pack=pack,
+                                                 wd=wd)
+
     def to_script(self, wf_name='wf'):
         """Generated and print the scriptcwl script for the currunt workflow.
 
@@ -633,7 +738,7 @@ class WorkflowGenerator(object):
         # tools can be added to the same workflow multiple times).
         name_in_wf = self._generate_step_name(step.name)
         step._set_name_in_workflow(name_in_wf)
-        self.steps_library.step_ids.append(name_in_wf)
+        self._step_ids.add(name_in_wf)
 
         # Create a reference for each output for use in subsequent
         # steps' inputs.
@@ -649,26 +754,62 @@ class WorkflowGenerator(object):
             return outputs[0]
         return outputs
 
-    def validate(self):
+    def validate(self, full=False, fast=False):
         """Validate workflow object.
 
-        This method currently validates the workflow object with the use of
-        cwltool. It writes the workflow to a tmp CWL file, reads it, validates
-        it and removes the tmp file again. By default, the workflow is written
-        to file using absolute paths to the steps.
+        The first time, the workflow object is validated with the use of
+        cwltool. The workflow document (with absolute paths to the steps) is
+        passed to cwltool directly, without writing it to file first.
+
+        After that, only the workflow inputs, steps and workflow outputs that
+        were added or changed since the last validation are checked (see
+        ``scriptcwl.validation``). The steps from the steps library were
+        validated when they were loaded, so they are not validated again.
+        Changes that cannot be checked this way cause the workflow to be
+        validated with cwltool again.
+
+        With ``fast=True``, the structure of the complete workflow is checked
+        without using cwltool (see ``scriptcwl.validation.check_workflow``):
+        the inputs of all steps must be connected to workflow inputs or
+        outputs of other steps, the steps must not form a cycle, the sources
+        of the workflow outputs must exist, scatter variables must be valid
+        and the requirements that are needed must be declared.
+
+        Args:
+            full (bool): validate the complete workflow with cwltool, even
+                if it was validated before (default: False).
+            fast (bool): only check the structure of the workflow, without
+                using cwltool (default: False).
+
+        Raises:
+            ValidationException: The workflow is invalid.
+        """
+        self._closed()
+
+        if fast:
+            if full:
+                raise ValueError('Choose either full or fast validation.')
+            check_workflow(self)
+            return
+
+        if not full and self._validation.validate(self):
+            return
+
+        self._validation.reset()
+        self._load_in_memory()
+        self._validation.record(self)
+
+    def _load_in_memory(self):
+        """Load and validate the workflow document with cwltool.
+
+        Returns:
+            the document loader, process object, metadata and uri of the
+            workflow (see ``load_cwl``).
         """
-        # define tmpfile
-        (fd, tmpfile) = tempfile.mkstemp()
-        os.close(fd)
-        try:
-            # save workflow object to tmpfile,
-            # do not recursively call validate function
-            self.save(tmpfile, mode='abs', validate=False)
-            # load workflow from tmpfile
-            document_loader, processobj, metadata, uri = load_cwl(tmpfile)
-        finally:
-            # cleanup tmpfile
-            os.remove(tmpfile)
+        obj = to_plain(self.to_obj(wd=False, pack=False, relpath=None))
+        # relative references are resolved against the current directory
+        uri = file_uri(os.path.join(os.getcwd(), 'workflow.cwl'))
+        return load_cwl_obj(obj, uri)
 
     def _pack(self, fname, encoding):
         """Save workflow with ``--pack`` option
@@ -677,20 +818,18 @@ class WorkflowGenerator(object):
         file that is created. A packed workflow cannot be loaded and used in
         scriptcwl.
         """
-        (fd, tmpfile) = tempfile.mkstemp()
-        os.close(fd)
-        try:
-            self.save(tmpfile, mode='abs', validate=False)
-            document_loader, processobj, metadata, uri = load_cwl(tmpfile)
-        finally:
-            # cleanup tmpfile
-            os.remove(tmpfile)
+        document_loader, processobj, metadata, uri = self._load_in_memory()
+
+        with quiet():
+            # all is quiet in this scope
+            from cwltool.main import print_pack
 
         with codecs.open(fname, 'wb', encoding=encoding) as f:
             f.write(print_pack(document_loader, processobj, uri, metadata))
 
     def save(self, fname, mode=None, validate=True, encoding='utf-8',
-             wd=False, inline=False, relative=False, pack=False):
+             wd=False, inline=False, relative=False, pack=False,
+             emitter='roundtrip'):
         """Save the workflow to file.
 
         Save the workflow to a CWL file that can be run with a CWL runner.
@@ -698,7 +837,14 @@ class WorkflowGenerator(object):
         Args:
             fname (str): file to save the workflow to.
             mode (str): one of  (rel, abs, wd, inline, pack)
+            validate (bool or str): validate the workflow before saving it
+                (default: True). Use ``'fast'`` to only check the structure
+                of the workflow, without using cwltool (see ``validate``).
             encoding (str): file encoding to use (default: ``utf-8``).
+            emitter (str): one of (roundtrip, fast, json). The ``fast`` and
+                ``json`` emitters are much faster for large workflows, but
+                do not preserve comments (default: ``roundtrip``). Packed
+                workflows are always saved as JSON.
         """
         self._closed()
 
@@ -722,7 +868,14 @@ class WorkflowGenerator(object):
                   .format(mode, ','.join(modes))
             raise ValueError(msg)
 
-        if validate:
+        if emitter not in EMITTERS:
+            msg = 'Illegal emitter "{}". Choose one of ({}).'\
+                  .format(emitter, ','.join(EMITTERS))
+            raise ValueError(msg)
+
+        if validate == 'fast':
+            self.validate(fast=True)
+        elif validate:
             self.validate()
 
         dirname = os.path.dirname(os.path.abspath(fname))
@@ -738,11 +891,11 @@ class WorkflowGenerator(object):
         if mode == 'rel':
             relpath = dirname
             save_yaml(fname=fname, wf=self, pack=False, relpath=relpath,
-                      wd=False)
+                      wd=False, emitter=emitter)
 
         if mode == 'abs':
             save_yaml(fname=fname, wf=self, pack=False, relpath=None,
-                      wd=False)
+                      wd=False, emitter=emitter)
 
         if mode == 'pack':
             self._pack(fname, encoding)
@@ -755,13 +908,11 @@ class WorkflowGenerator(object):
                 bn = os.path.basename(fname)
                 wd_file = os.path.join(self.working_dir, bn)
                 save_yaml(fname=wd_file, wf=self, pack=False, relpath=None,
-                          wd=True)
+                          wd=True, emitter=emitter)
                 # and copy workflow file to other location (as though all steps
-                # are in the same directory as the workflow)
-                try:
-                    shutil.copy2(wd_file, fname)
-                except shutil.Error:
-                    pass
+                # are in the same directory as the workflow). The copy must not
+                # be a link into the working directory, which may be removed.
+                stage_file(wd_file, fname, staging='changed')
 
     def get_working_dir(self):
         return self.working_dir
@@ -1,11 +1,37 @@
 """Functionality for saving yaml files.
+
+Workflows can be serialized with different emitters (see ``EMITTERS``):
+
+* ``roundtrip``: YAML, using ruamel's (pure Python) round trip dumper. This
+  preserves comments in loaded CWL files, e.g., in (packed) steps.
+* ``fast``: YAML, using ruamel's libyaml based emitter, if it is available.
+* ``json``: JSON, using the ``json`` module. CWL runners accept JSON, because
+  it is valid YAML.
+
+All emitters create the same document.
+
+Workflows are written to file incrementally: first everything but the steps,
+and then the steps in chunks of ``STEPS_PER_CHUNK`` steps. So, the memory
+needed to save a workflow does not grow with the number of steps.
 """
+import io
+import json
 import codecs
 
+import six
 from ruamel import yaml
+from ruamel.yaml.comments import CommentedMap
+from ruamel.yaml.representer import SafeRepresenter
 
 from .reference import Reference, reference_presenter
 
+EMITTERS = ('roundtrip', 'fast', 'json')
+
+SHEBANG = u'#!/usr/bin/env cwl-runner'
+
+# Number of steps that are serialized at the same time
+STEPS_PER_CHUNK = 100
+
 
 def is_multiline(s):
     """Return True if a str consists of multiple lines.
@@ -30,21 +56,133 @@ def str_presenter(dmpr, data):
     return dmpr.represent_scalar('tag:yaml.org,2002:str', data)
 
 
-def yaml2string(wf, pack, relpath, wd):
-    s = [u'#!/usr/bin/env cwl-runner',
-         yaml.dump(wf.to_obj(pack=pack, relpath=relpath, wd=wd),
-                   Dumper=yaml.RoundTripDumper)]
-    return u'\n'.join(s)
+class FastRepresenter(SafeRepresenter):
+    """Representer for the ``fast`` emitter that keeps the order of keys."""
+    pass
+
 
+def to_plain(obj):
+    """Convert a workflow document to builtin types.
 
-def save_yaml(fname, wf, pack, relpath, wd, encoding='utf-8'):
+    ruamel's round trip types (e.g., ``CommentedMap`` and scalar strings) are
+    converted to dicts, lists, strings and numbers, and References to
+    strings, so the document can be serialized with the ``fast`` and
+    ``json`` emitters.
+    """
+    if isinstance(obj, dict):
+        return dict([(six.text_type(k), to_plain(v)) for k, v in obj.items()])
+    elif isinstance(obj, (list, tuple)):
+        return [to_plain(v) for v in obj]
+    elif isinstance(obj, (six.string_types, Reference)):
+        return six.text_type(obj)
+    elif isinstance(obj, bool) or obj is None:
+        return obj
+    elif isinstance(obj, six.integer_types):
+        return int(obj)
+    elif isinstance(obj, float):
+        return float(obj)
+    return obj
+
+
+def dump_fast(obj, stream):
+    """Write a document as block style YAML with the fastest available
+    emitter.
+    """
+    dumper = yaml.YAML(typ='safe')
+    dumper.Representer = FastRepresenter
+    dumper.sort_base_mapping_type_on_output = False
+    dumper.default_flow_style = False
+    dumper.allow_unicode = True
+    dumper.dump(obj, stream)
+
+
+def dump(obj, emitter='roundtrip'):
+    """Return a document as string, serialized with an emitter."""
+    if emitter == 'json':
+        return json.dumps(to_plain(obj), indent=2, ensure_ascii=False)
+    elif emitter == 'fast':
+        stream = io.StringIO()
+        dump_fast(to_plain(obj), stream)
+        return stream.getvalue()
+    elif emitter == 'roundtrip':
+        return yaml.dump(obj, Dumper=yaml.RoundTripDumper)
+    msg = 'Illegal emitter "{}". Choose one of ({}).'\
+          .format(emitter, ','.join(EMITTERS))
+    raise ValueError(msg)
+
+
+def iter_chunks(items, size):
+    """Generate lists of ``size`` items (the last list may be shorter)."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_workflow(stream, wf, pack, relpath, wd, emitter='roundtrip'):
+    """Write a workflow to a stream, one chunk of steps at a time.
+
+    The result is the same as serializing ``wf.to_obj()`` as a whole.
+    Every chunk of steps is serialized as the ``steps`` of a workflow, so it
+    is indented in the same way as in the complete document, and the lines
+    that do not belong to the steps are removed.
+    """
+    header = dump(wf.to_obj(pack=pack, relpath=relpath, wd=wd,
+                            include_steps=False), emitter)
+    chunks = iter_chunks(wf.iter_steps_obj(pack=pack, relpath=relpath,
+                                           wd=wd), STEPS_PER_CHUNK)
+
+    if emitter == 'json':
+        # the header ends with '\n}'
+        stream.write(header[:-2])
+        stream.write(u',\n  "steps": {')
+        separator = u'\n'
+        for chunk in chunks:
+            lines = dump({'steps': CommentedMap(chunk)}, emitter).split('\n')
+            stream.write(separator)
+            stream.write(u'\n'.join(lines[2:-2]))
+            separator = u',\n'
+        if separator == u'\n':
+            stream.write(u'}\n}')
+        else:
+            stream.write(u'\n  }\n}')
+        return
+
+    stream.write(SHEBANG)
+    stream.write(u'\n')
+    stream.write(header)
+    first = True
+    for chunk in chunks:
+        steps = dump(CommentedMap([('steps', CommentedMap(chunk))]), emitter)
+        if not first:
+            # remove the 'steps:' line
+            steps = steps.split(u'\n', 1)[1]
+        stream.write(steps)
+        first = False
+    if first:
+        stream.write(dump(CommentedMap([('steps', CommentedMap())]),
+                          emitter))
+
+
+def yaml2string(wf, pack, relpath, wd, emitter='roundtrip'):
+    stream = io.StringIO()
+    write_workflow(stream, wf, pack=pack, relpath=relpath, wd=wd,
+                   emitter=emitter)
+    return stream.getvalue()
+
+
+def save_yaml(fname, wf, pack, relpath, wd, encoding='utf-8',
+              emitter='roundtrip'):
     with codecs.open(fname, 'wb', encoding=encoding) as yaml_file:
-        yaml_file.write(yaml2string(wf=wf,
-                                    pack=pack,
-                                    relpath=relpath,
-                                    wd=wd))
+        write_workflow(yaml_file, wf=wf, pack=pack, relpath=relpath, wd=wd,
+                       emitter=emitter)
 
 
 yaml.add_representer(str, str_presenter, Dumper=yaml.RoundTripDumper)
 yaml.add_representer(Reference, reference_presenter,
                      Dumper=yaml.RoundTripDumper)
+FastRepresenter.add_representer(str, str_presenter)
@@ -69,7 +69,8 @@ setup(
     install_requires=[
         'six',
         'cwltool==1.0.20180721142728',
-        'click'],
+        'click',
+        'requests'],
     setup_requires=[
         # dependency for `python setup.py test`
         'pytest-runner',
@@ -0,0 +1,150 @@
+import pytest
+
+import os
+import shutil
+import zipfile
+
+from scriptcwl import WorkflowGenerator
+from scriptcwl import library
+from scriptcwl import step as step_module
+from scriptcwl.bundle import create_bundle, read_bundle_index
+from scriptcwl.cache import file_hash
+from scriptcwl.library import StepsLibrary
+
+
+@pytest.fixture
+def bundle(tmpdir):
+    bundle = tmpdir.join('steps.zip').strpath
+    create_bundle(bundle, step_list=['tests/data/tools',
+                                     'tests/data/workflows/echo-wc_wd.cwl',
+                                     'tests/data/misc/align-dir-pack.cwl'])
+    return bundle
+
+
+def test_index(bundle):
+    index = read_bundle_index(bundle)
+    entries = dict([(e['name'], e) for e in index['steps']])
+
+    assert sorted(entries.keys()) == ['align-dir-pack', 'echo', 'echo-wc_wd',
+                                      'multiple-out-args', 'wc']
+    assert entries['echo']['signature'] == 'echoed = wf.echo(message)'
+    assert entries['echo-wc_wd']['is_workflow']
+    assert 'error' in entries['align-dir-pack']
+
+
+def test_not_a_bundle(tmpdir):
+    fname = tmpdir.join('not-a-bundle.zip').strpath
+    with zipfile.ZipFile(fname, 'w') as z:
+        z.writestr('echo.cwl', '')
+
+    with pytest.raises(ValueError):
+        read_bundle_index(fname)
+
+
+def test_load_bundle(bundle):
+    lib = StepsLibrary()
+    lib.load(bundle=bundle)
+
+    assert lib.steps == {}
+    assert sorted(lib.step_files.keys()) == ['echo', 'echo-wc_wd',
+                                             'multiple-out-args', 'wc']
+    assert lib.get_step('echo').input_names == ['message']
+
+
+def test_load_workflow_from_bundle(bundle):
+    lib = StepsLibrary()
+    lib.load(bundle=bundle)
+
+    assert lib.get_step('echo-wc_wd').is_workflow
+
+
+def test_save_wd_from_bundle(bundle, tmpdir):
+    wf = WorkflowGenerator(working_dir=tmpdir.join('wd').strpath)
+    wf.load(bundle=bundle)
+    msg = wf.add_input(msg='string')
+    wf.add_outputs(echoed=wf.echo(message=msg))
+    wf.save(tmpdir.join('wf.cwl').strpath, mode='wd')
+
+    assert tmpdir.join('wd', 'echo.cwl').check()
+    assert not tmpdir.join('wd', 'wc.cwl').check()
+
+
+def test_bundled_steps_are_not_validated_again(bundle, monkeypatch):
+    def fail(fname, loading_context=None):
+        raise AssertionError('{} validated again'.format(fname))
+    monkeypatch.setattr(step_module, 'load_cwl', fail)
+
+    lib = StepsLibrary()
+    lib.load(bundle=bundle)
+
+    assert lib.get_step('echo').input_names == ['message']
+    assert lib.get_step('echo-wc_wd').is_workflow
+
+
+def test_extract_to_tmp_dir_is_removed_at_exit(bundle, monkeypatch):
+    registered = []
+    monkeypatch.setattr(library.atexit, 'register',
+                        lambda *args: registered.append(args))
+
+    lib = StepsLibrary()
+    lib.load(bundle=bundle)
+    lib.get_step('echo')
+
+    extract_dir = os.path.dirname(lib.get_step('echo').run)
+    assert registered == [(shutil.rmtree, extract_dir, True)]
+    shutil.rmtree(extract_dir)
+
+
+def test_extract_to_cache_dir(bundle, tmpdir):
+    cache_dir = tmpdir.join('cache').strpath
+    lib = StepsLibrary(cache_dir=cache_dir)
+    lib.load(bundle=bundle)
+
+    extract_dir = os.path.join(cache_dir, 'bundles', file_hash(bundle))
+    assert lib.get_step('echo').run == os.path.join(extract_dir, 'echo.cwl')
+
+
+def test_stage_bundled_steps(bundle, tmpdir):
+    cache_dir = tmpdir.join('cache').strpath
+    wd = tmpdir.join('wd').strpath
+    lib = StepsLibrary(working_dir=wd, cache_dir=cache_dir, staging='symlink')
+    lib.load(bundle=bundle)
+
+    step = lib.get_step('echo')
+
+    extract_dir = os.path.join(cache_dir, 'bundles', file_hash(bundle))
+    assert step.run == os.path.join(wd, 'echo.cwl')
+    assert os.path.islink(step.run)
+    assert os.path.realpath(step.run) == \
+        os.path.realpath(os.path.join(extract_dir, 'echo.cwl'))
+
+
+def test_no_symlinks_to_tmp_dir(bundle, tmpdir):
+    wd = tmpdir.join('wd').strpath
+    lib = StepsLibrary(working_dir=wd, staging='symlink')
+    lib.load(bundle=bundle)
+
+    step = lib.get_step('echo')
+
+    assert os.path.isfile(step.run)
+    assert not os.path.islink(step.run)
+
+
+def test_bundle_is_read_once(bundle, tmpdir, monkeypatch):
+    calls = []
+
+    def counting(f):
+        def wrapper(fname, *args):
+            calls.append((f.__name__, fname))
+            return f(fname, *args)
+        return wrapper
+    monkeypatch.setattr(library, 'file_hash', counting(library.file_hash))
+    monkeypatch.setattr(library, 'read_bundle_index',
+                        counting(library.read_bundle_index))
+
+    lib = StepsLibrary(cache_dir=tmpdir.join('cache').strpath)
+    lib.load(bundle=bundle)
+    lib.get_step('echo')
+    lib.get_step('echo-wc_wd')
+
+    assert calls == [('read_bundle_index', bundle), ('file_hash', bundle)]
@@ -0,0 +1,99 @@
+import pytest
+
+from shutil import copy, copytree
+
+from scriptcwl import library
+from scriptcwl.cache import StepCache, file_hash, run_targets
+from scriptcwl.library import load_steps
+from scriptcwl.step import Step
+
+
+@pytest.fixture
+def echo(tmpdir):
+    return copy('tests/data/tools/echo.cwl', tmpdir.strpath)
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return StepCache(tmpdir.join('cache').strpath)
+
+
+def test_get_not_cached(cache, echo):
+    assert cache.get(echo) is None
+
+
+def test_put_get(cache, echo):
+    cache.put(echo, Step(echo))
+    step = cache.get(echo)
+
+    assert step.name == 'echo'
+    assert step.input_names == ['message']
+    assert step.sha256 == file_hash(echo)
+
+
+def test_changed_file_not_cached(cache, echo):
+    cache.put(echo, Step(echo))
+    with open(echo, 'a') as f:
+        f.write('\n# changed\n')
+
+    assert cache.get(echo) is None
+
+
+def test_url_not_cached(cache):
+    assert cache.key('https://example.com/echo.cwl') is None
+
+
+def test_clear(cache, echo):
+    cache.put(echo, Step(echo))
+    cache.clear()
+
+    assert cache.size() == 0
+    assert cache.get(echo) is None
+
+
+def test_prune(cache, echo):
+    cache.put(echo, Step(echo))
+    assert cache.size() > 0
+
+    cache.prune(0)
+    assert cache.size() == 0
+
+
+def test_load_steps_from_cache(cache, echo, monkeypatch):
+    load_steps(step_file=echo, cache=cache)
+
+    def fail(fname):
+        raise AssertionError('Step validated again')
+    monkeypatch.setattr(library, 'Step', fail)
+    steps = load_steps(step_file=echo, cache=cache)
+
+    assert list(steps.keys()) == ['echo']
+
+
+def test_trusted_steps_not_cached(cache, echo):
+    load_steps(step_file=echo, cache=cache, trusted=True)
+
+    assert cache.size() == 0
+
+
+@pytest.fixture
+def workflow(tmpdir):
+    copytree('tests/data/tools', tmpdir.join('tools').strpath)
+    copytree('tests/data/workflows', tmpdir.join('workflows').strpath)
+    return tmpdir.join('workflows', 'echo-wc.cwl').strpath
+
+
+def test_run_targets(workflow, tmpdir):
+    assert run_targets(workflow) == [tmpdir.join('tools', 'echo.cwl').strpath,
+                                     tmpdir.join('tools', 'wc.cwl').strpath]
+    assert run_targets(tmpdir.join('tools', 'echo.cwl').strpath) == []
+
+
+def test_changed_tool_of_workflow_not_cached(cache, workflow, tmpdir):
+    cache.put(workflow, Step(workflow))
+    assert cache.get(workflow) is not None
+
+    with open(tmpdir.join('tools', 'wc.cwl').strpath, 'a') as f:
+        f.write('\n# changed\n')
+
+    assert cache.get(workflow) is None
@@ -2,8 +2,12 @@ import pytest
 
 import os
 from pathlib import Path
+from shutil import copy, copytree
 
-from scriptcwl.library import load_yaml, load_steps
+from scriptcwl import library
+from scriptcwl.library import StepsLibrary, load_yaml, load_steps, \
+    scan_header, sort_loading_order, scan_dir, find_step_files, stage_file, \
+    stage_step_files
 
 
 data_dir = Path(os.path.dirname(os.path.realpath(__file__))) / 'data' / 'misc'
@@ -21,3 +25,430 @@ def test_load_steps_file_packed(datafiles):
     cwl_file = str(datafiles.listdir()[0])
 
     assert {} == load_steps(step_file=cwl_file)
+
+
+def test_load_steps_parallel():
+    serial = load_steps(steps_dir='tests/data/tools')
+    parallel = load_steps(steps_dir='tests/data/tools', workers=2)
+
+    assert sorted(parallel.keys()) == sorted(serial.keys())
+    for name, step in parallel.items():
+        assert step.input_types == serial[name].input_types
+        assert step.output_types == serial[name].output_types
+
+
+def test_load_steps_parallel_working_dir(tmpdir):
+    # the workflow is listed first, but can only be validated after the
+    # tools have been copied to the working directory
+    step_list = ['tests/data/workflows/echo-wc_wd.cwl', 'tests/data/tools']
+    steps = load_steps(working_dir=tmpdir.strpath, step_list=step_list,
+                       workers=2)
+
+    assert sorted(steps.keys()) == ['echo', 'echo-wc_wd',
+                                    'multiple-out-args', 'wc']
+    assert steps['echo-wc_wd'].run == tmpdir.join('echo-wc_wd.cwl').strpath
+
+
+def test_load_steps_parallel_packed():
+    cwl_file = str(Path(data_dir) / 'align-dir-pack.cwl')
+    step_list = [cwl_file, 'tests/data/tools/echo.cwl']
+
+    assert ['echo'] == list(load_steps(step_list=step_list, workers=2))
+
+
+class TestLazyStepsLibrary(object):
+    @pytest.fixture
+    def library(self):
+        lib = StepsLibrary(lazy=True)
+        lib.load(step_list=['tests/data/tools',
+                            'tests/data/misc/non-python-names.cwl'])
+        return lib
+
+    def test_load_registers_names(self, library):
+        assert library.steps == {}
+        assert sorted(library.step_files.keys()) == [
+            'echo', 'multiple-out-args', 'non-python-names', 'wc']
+        assert library.python_names2step_names['non_python_names'] == \
+            'non-python-names'
+
+    def test_get_step_validates(self, library):
+        step = library.get_step('echo')
+
+        assert step.input_names == ['message']
+        assert list(library.steps.keys()) == ['echo']
+        assert 'echo' not in library.step_files
+
+    def test_list_steps_validates_all(self, library):
+        expected = StepsLibrary()
+        expected.load(step_list=['tests/data/tools',
+                                 'tests/data/misc/non-python-names.cwl'])
+
+        assert library.list_steps() == expected.list_steps()
+        assert library.step_files == {}
+
+    def test_duplicate_step(self, library):
+        with pytest.warns(UserWarning):
+            library.load(step_file='tests/data/tools/echo.cwl')
+
+    def test_invalid_step_removed(self):
+        lib = StepsLibrary(lazy=True)
+        lib.load(step_file=str(Path(data_dir) / 'align-dir-pack.cwl'))
+
+        assert lib.get_step('align-dir-pack') is None
+        assert lib.python_names2step_names == {}
+
+
+class TestRefreshStepsLibrary(object):
+    @pytest.fixture
+    def steps_dir(self, tmpdir):
+        steps_dir = tmpdir.join('tools')
+        copytree('tests/data/tools', steps_dir.strpath)
+        return steps_dir
+
+    @pytest.fixture(params=[False, True])
+    def library(self, request, steps_dir):
+        lib = StepsLibrary(lazy=request.param)
+        lib.load(steps_dir=steps_dir.strpath)
+        return lib
+
+    def test_nothing_changed(self, library):
+        changes = library.refresh()
+
+        assert changes == {'added': [], 'modified': [], 'deleted': []}
+
+    def test_added(self, library, steps_dir):
+        copy('tests/data/misc/echo2.cwl', steps_dir.strpath)
+        changes = library.refresh()
+
+        assert changes['added'] == ['echo2']
+        assert library.get_step('echo2') is not None
+        assert library.python_names2step_names['echo2'] == 'echo2'
+
+    def test_deleted(self, library, steps_dir):
+        steps_dir.join('wc.cwl').remove()
+        changes = library.refresh()
+
+        assert changes['deleted'] == ['wc']
+        assert library.get_step('wc') is None
+        assert 'wc' not in library.python_names2step_names
+
+    def test_modified(self, library, steps_dir):
+        library.get_step('echo')
+        cwl = steps_dir.join('echo.cwl')
+        cwl.write(cwl.read().replace('message', 'msg'))
+        changes = library.refresh()
+
+        assert changes['modified'] == ['echo']
+        assert library.get_step('echo').input_names == ['msg']
+
+
+@pytest.mark.parametrize('cwl_file,expected', [
+    ('tests/data/tools/echo.cwl',
+     {'class': 'CommandLineTool', 'subworkflows': False}),
+    ('tests/data/workflows/echo-wc.cwl',
+     {'class': 'Workflow', 'subworkflows': False}),
+    ('tests/data/echo-wc.workflowstep.cwl',
+     {'class': 'Workflow', 'subworkflows': True}),
+    ('tests/data/misc/align-dir-pack.cwl', None),
+])
+def test_scan_header(cwl_file, expected):
+    assert scan_header(cwl_file) == expected
+
+
+def test_sort_loading_order():
+    step_files = ['tests/data/echo-wc.workflowstep.cwl',
+                  'tests/data/workflows/echo-wc.cwl',
+                  'tests/data/tools/echo.cwl',
+                  'tests/data/misc/align-dir-pack.cwl']
+
+    assert sort_loading_order(step_files) == [
+        'tests/data/tools/echo.cwl',
+        'tests/data/misc/align-dir-pack.cwl',
+        'tests/data/workflows/echo-wc.cwl',
+        'tests/data/echo-wc.workflowstep.cwl']
+
+
+def test_load_steps_duplicate_file():
+    step_list = ['tests/data/tools/echo.cwl', 'tests/data/tools/echo.cwl']
+
+    assert ['echo'] == list(load_steps(step_list=step_list))
+
+
+class TestScanDir(object):
+    @pytest.fixture
+    def tree(self, tmpdir):
+        for f in ['a.cwl', 'b.txt', '.hidden.cwl', 'sub/c.cwl',
+                  'sub/deeper/d.cwl', 'sub/test/e.cwl', '.git/f.cwl',
+                  'node_modules/g.cwl']:
+            tmpdir.join(f).ensure()
+        return tmpdir
+
+    def names(self, files, root):
+        return sorted([os.path.relpath(f, root.strpath) for f in files])
+
+    def test_not_recursive(self, tree):
+        files = scan_dir(tree.strpath)
+
+        assert self.names(files, tree) == ['a.cwl']
+
+    def test_recursive(self, tree):
+        files = scan_dir(tree.strpath, recursive=True)
+
+        assert self.names(files, tree) == [
+            'a.cwl', os.path.join('sub', 'c.cwl'),
+            os.path.join('sub', 'deeper', 'd.cwl'),
+            os.path.join('sub', 'test', 'e.cwl')]
+
+    def test_include_exclude(self, tree):
+        files = scan_dir(tree.strpath, recursive=True,
+                         include=['*.cwl', '*.txt'],
+                         exclude=['test', 'sub/deeper/*'])
+
+        assert self.names(files, tree) == [
+            'a.cwl', 'b.txt', os.path.join('sub', 'c.cwl')]
+
+    def test_generator(self, tree):
+        files = scan_dir(tree.strpath, recursive=True)
+
+        assert next(files) == tree.join('a.cwl').strpath
+
+    def test_find_step_files_missing_dir(self, tmpdir):
+        steps_dir = tmpdir.join('missing').strpath
+
+        assert find_step_files(steps_dir=steps_dir, recursive=True) == []
+
+    def test_load_and_refresh_recursive(self, tmpdir):
+        copytree('tests/data/tools', tmpdir.join('tools').strpath)
+        lib = StepsLibrary()
+        lib.load(steps_dir=tmpdir.strpath, recursive=True,
+                 exclude=['multiple-out-args.cwl'])
+
+        assert sorted(lib.steps.keys()) == ['echo', 'wc']
+
+        tmpdir.join('misc').ensure(dir=True)
+        copy('tests/data/misc/echo2.cwl', tmpdir.join('misc').strpath)
+        changes = lib.refresh()
+
+        assert changes == {'added': ['echo2'], 'modified': [], 'deleted': []}
+
+    def test_duplicate_step_names(self, tmpdir):
+        with open('tests/data/tools/echo.cwl') as f:
+            cwl = f.read()
+        steps_dir = tmpdir.join('steps')
+        steps_dir.join('a', 'echo.cwl').write(cwl, ensure=True)
+        steps_dir.join('b', 'echo.cwl').write(
+            cwl.replace('message', 'msg'), ensure=True)
+        wd = tmpdir.join('wd').ensure(dir=True).strpath
+
+        lib = StepsLibrary(working_dir=wd)
+        with pytest.warns(UserWarning) as record:
+            lib.load(steps_dir=steps_dir.strpath, recursive=True)
+
+        assert len(record) == 1
+        assert steps_dir.join('b', 'echo.cwl').strpath in \
+            str(record[0].message)
+        assert sorted(lib.steps.keys()) == ['echo']
+        assert lib.get_step('echo').input_names == ['message']
+        assert tmpdir.join('wd', 'echo.cwl').read() == \
+            steps_dir.join('a', 'echo.cwl').read()
+
+
+class TestStageFile(object):
+    @pytest.fixture
+    def src(self, tmpdir):
+        src = tmpdir.join('src', 'echo.cwl')
+        src.write('content', ensure=True)
+        return src
+
+    @pytest.mark.parametrize('staging', ['copy', 'changed', 'hardlink',
+                                         'symlink', 'reflink'])
+    def test_stage_file(self, tmpdir, src, staging):
+        dst = tmpdir.join('echo.cwl')
+        dst.write('old content')
+        stage_file(src.strpath, dst.strpath, staging=staging)
+
+        assert dst.read() == 'content'
+        assert tmpdir.listdir(fil=lambda p: p.ext == '.tmp') == []
+
+    def test_changed_skips_identical_file(self, tmpdir, src):
+        dst = tmpdir.join('echo.cwl')
+        dst.write('content')
+        inode = dst.stat().ino
+        stage_file(src.strpath, dst.strpath, staging='changed')
+
+        assert dst.stat().ino == inode
+
+    def test_links(self, tmpdir, src):
+        hardlink = tmpdir.join('hardlink.cwl')
+        symlink = tmpdir.join('symlink.cwl')
+        stage_file(src.strpath, hardlink.strpath, staging='hardlink')
+        stage_file(src.strpath, symlink.strpath, staging='symlink')
+
+        assert hardlink.samefile(src)
+        assert symlink.islink()
+        assert symlink.realpath() == src
+
+    def test_replace_does_not_change_linked_file(self, tmpdir, src):
+        dst = tmpdir.join('echo.cwl')
+        stage_file(src.strpath, dst.strpath, staging='hardlink')
+        other = tmpdir.join('other.cwl')
+        other.write('other content')
+        stage_file(other.strpath, dst.strpath, staging='copy')
+
+        assert dst.read() == 'other content'
+        assert src.read() == 'content'
+
+    def test_stage_concurrently(self, tmpdir):
+        step_files = [str(f) for f in Path('tests/data/tools').glob('*.cwl')]
+        staged = stage_step_files(step_files, tmpdir.strpath, workers=4)
+
+        assert sorted(staged) == sorted([
+            tmpdir.join(os.path.basename(f)).strpath for f in step_files])
+
+    def test_illegal_staging(self):
+        with pytest.raises(ValueError):
+            StepsLibrary(staging='move')
+
+
+class TestSnapshot(object):
+    @pytest.fixture
+    def steps_dir(self, tmpdir):
+        steps_dir = tmpdir.join('tools')
+        copytree('tests/data/tools', steps_dir.strpath)
+        return steps_dir
+
+    @pytest.fixture
+    def snapshot(self, tmpdir, steps_dir):
+        lib = StepsLibrary()
+        lib.load(steps_dir=steps_dir.strpath)
+        snapshot = tmpdir.join('steps.snapshot').strpath
+        lib.save_snapshot(snapshot)
+        return snapshot
+
+    def test_from_snapshot(self, snapshot, monkeypatch):
+        def fail(fname, loading_context=None):
+            raise AssertionError('Step validated again')
+        monkeypatch.setattr(library, 'Step', fail)
+        lib = StepsLibrary.from_snapshot(snapshot)
+
+        assert sorted(lib.steps.keys()) == ['echo', 'multiple-out-args', 'wc']
+        assert lib.python_names2step_names['multiple_out_args'] == \
+            'multiple-out-args'
+        assert lib.get_step('echo').input_names == ['message']
+
+    def test_stale_snapshot(self, snapshot, steps_dir):
+        cwl = steps_dir.join('echo.cwl')
+        cwl.write(cwl.read().replace('message', 'msg'))
+        steps_dir.join('wc.cwl').remove()
+        lib = StepsLibrary.from_snapshot(snapshot)
+
+        assert sorted(lib.steps.keys()) == ['echo', 'multiple-out-args']
+        assert lib.get_step('echo').input_names == ['msg']
+
+        # the snapshot was updated
+        lib = StepsLibrary.from_snapshot(snapshot, verify=False)
+        assert lib.get_step('echo').input_names == ['msg']
+
+    def test_lazy_library_snapshot(self, tmpdir, steps_dir):
+        lib = StepsLibrary(lazy=True)
+        lib.load(steps_dir=steps_dir.strpath)
+        snapshot = tmpdir.join('steps.snapshot').strpath
+        lib.save_snapshot(snapshot)
+
+        lib = StepsLibrary.from_snapshot(snapshot)
+        assert sorted(lib.steps.keys()) == ['echo', 'multiple-out-args', 'wc']
+
+
+class TestTypeIndex(object):
+    @pytest.fixture(params=[False, True])
+    def library(self, request):
+        lib = StepsLibrary(lazy=request.param)
+        lib.load(step_list=['tests/data/tools', 'tests/data/misc/echo2.cwl',
+                            'tests/data/misc/non-python-names.cwl'])
+        return lib
+
+    @pytest.mark.parametrize('typ,expected', [
+        ('string', ['echo', 'non-python-names']),
+        ('string[]', ['echo2', 'multiple-out-args']),
+        ({'type': 'array', 'items': 'File'}, ['multiple-out-args']),
+        ('File', ['wc']),
+        ('Directory?', ['multiple-out-args']),
+        ('int', []),
+    ])
+    def test_steps_consuming(self, library, typ, expected):
+        assert library.steps_consuming(typ) == expected
+
+    def test_steps_consuming_required(self, library):
+        assert library.steps_consuming('Directory', optional=False) == []
+
+    def test_steps_producing(self, library):
+        assert library.steps_producing('File[]') == ['multiple-out-args']
+        assert library.steps_producing('File') == [
+            'echo', 'echo2', 'multiple-out-args', 'non-python-names', 'wc']
+
+    def test_removed_step(self, tmpdir):
+        copytree('tests/data/tools', tmpdir.join('tools').strpath)
+        lib = StepsLibrary()
+        lib.load(steps_dir=tmpdir.join('tools').strpath)
+        tmpdir.join('tools', 'wc.cwl').remove()
+        lib.refresh()
+
+        assert lib.steps_consuming('File') == []
+        assert 'File' not in lib.type_index.consumers
+
+
+class TestStepListing(object):
+    @pytest.fixture
+    def library(self):
+        lib = StepsLibrary()
+        lib.load(step_list=['tests/data/tools', 'tests/data/misc/echo2.cwl',
+                            'tests/data/echo.scattered.cwl'])
+        return lib
+
+    def expected_listing(self, library):
+        # how the listing was created before it was cached
+        steps = []
+        workflows = []
+        template = u'  {:.<25} {}'
+        for name, step in library.steps.items():
+            if step.is_workflow:
+                workflows.append(template.format(name, step))
+            else:
+                steps.append(template.format(name, step))
+        steps.sort()
+        workflows.sort()
+        return u''.join([u'Steps\n', u'\n'.join(steps), u'\n\nWorkflows\n',
+                         u'\n'.join(workflows)])
+
+    def test_list_steps(self, library):
+        assert library.list_steps() == self.expected_listing(library)
+        assert library.list_steps() is library.list_steps()
+
+    def test_list_steps_updated(self, library):
+        library.list_steps()
+        library.load(step_file='tests/data/misc/echo3.cwl')
+        library._remove('wc', library.step_sources['wc'])
+
+        assert 'echo3' in library.list_steps()
+        assert 'wc' not in library.list_steps()
+        assert library.list_steps() == self.expected_listing(library)
+
+    def test_step_signatures(self, library):
+        signatures = library.step_signatures()
+
+        assert [s['name'] for s in signatures] == [
+            'echo', 'echo.scattered', 'echo2', 'multiple-out-args', 'wc']
+        assert signatures[0] == {'name': 'echo', 'python_name': 'echo',
+                                 'is_workflow': False,
+                                 'signature': 'echoed = wf.echo(message)'}
+
+    @pytest.mark.parametrize('kwargs,expected', [
+        ({'workflows': True}, ['echo.scattered']),
+        ({'workflows': False, 'pattern': 'echo*'}, ['echo', 'echo2']),
+        ({'offset': 1, 'limit': 2}, ['echo.scattered', 'echo2']),
+        ({'workflows': False, 'offset': 1, 'limit': 1}, ['echo2']),
+    ])
+    def test_filter_step_signatures(self, library, kwargs, expected):
+        signatures = library.step_signatures(**kwargs)
+
+        assert [s['name'] for s in signatures] == expected
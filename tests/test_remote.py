@@ -0,0 +1,136 @@
+import pytest
+
+import hashlib
+import os
+import threading
+from shutil import copytree
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from scriptcwl import library
+from scriptcwl.cache import StepCache
+from scriptcwl.library import StepsLibrary, load_steps
+from scriptcwl.remote import HTTPCache, fetch_urls
+
+
+class StepsHandler(BaseHTTPRequestHandler):
+    """Serve CWL files with an ETag, and count the requests."""
+    def do_GET(self):
+        fname = os.path.join(self.server.root, self.path.lstrip('/'))
+        self.server.requests.append(self.path)
+        if not os.path.isfile(fname):
+            self.send_error(404)
+            return
+        with open(fname, 'rb') as f:
+            data = f.read()
+        etag = '"{}"'.format(hashlib.sha256(data).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.server.downloads.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/yaml')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmpdir):
+    httpd = HTTPServer(('127.0.0.1', 0), StepsHandler)
+    httpd.root = tmpdir.join('tools').strpath
+    copytree('tests/data/tools', httpd.root)
+    httpd.requests = []
+    httpd.downloads = []
+    httpd.url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def urls(server):
+    return [server.url + f for f in ('echo.cwl', 'wc.cwl')]
+
+
+def test_fetch_urls(server, urls):
+    results = fetch_urls(urls + [server.url + 'missing.cwl'])
+
+    assert results[0][0].startswith('#!/usr/bin/env cwl-runner')
+    assert results[0][1] is None
+    assert results[2][0] is None
+    assert 'missing.cwl' in results[2][1]
+
+
+def test_fetch_urls_conditional(server, urls, tmpdir):
+    cache = HTTPCache(tmpdir.join('cache').strpath)
+    first = fetch_urls(urls, cache=cache)
+    second = fetch_urls(urls, cache=cache)
+
+    assert first == second
+    assert len(server.requests) == 4
+    assert sorted(server.downloads) == ['/echo.cwl', '/wc.cwl']
+
+
+def test_fetch_urls_server_down(server, urls, tmpdir):
+    cache = HTTPCache(tmpdir.join('cache').strpath)
+    first = fetch_urls(urls, cache=cache)
+    server.shutdown()
+    server.server_close()
+
+    assert fetch_urls(urls, cache=cache) == first
+
+
+def test_load_steps_downloads_once(server, urls):
+    steps = load_steps(step_list=urls)
+
+    assert sorted(steps.keys()) == ['echo', 'wc']
+    assert sorted(server.downloads) == ['/echo.cwl', '/wc.cwl']
+
+
+def test_load_steps_not_modified(server, urls, tmpdir, monkeypatch):
+    cache = StepCache(tmpdir.join('cache').strpath)
+    load_steps(step_list=urls, cache=cache)
+
+    def fail(fname, loading_context=None):
+        raise AssertionError('{} validated again'.format(fname))
+
+    monkeypatch.setattr(library, 'Step', fail)
+    steps = load_steps(step_list=urls, cache=cache)
+
+    assert sorted(steps.keys()) == ['echo', 'wc']
+    assert steps['echo'].run == urls[0]
+    assert len(server.downloads) == 2
+
+
+def test_load_steps_modified(server, urls, tmpdir):
+    cache = StepCache(tmpdir.join('cache').strpath)
+    load_steps(step_list=urls, cache=cache)
+    cwl = tmpdir.join('tools', 'echo.cwl')
+    cwl.write(cwl.read().replace('message', 'msg'))
+    steps = load_steps(step_list=urls, cache=cache)
+
+    assert steps['echo'].input_names == ['msg']
+    assert sorted(server.downloads) == ['/echo.cwl', '/echo.cwl', '/wc.cwl']
+
+
+def test_outdated_snapshot_with_url_step(server, urls, tmpdir, monkeypatch):
+    lib = StepsLibrary()
+    lib.load(step_list=['tests/data/misc/echo2.cwl', urls[1]])
+    snapshot = tmpdir.join('steps.snapshot').strpath
+    lib.save_snapshot(snapshot)
+
+    monkeypatch.setattr(library, 'cwltool_version', lambda: 'other')
+    lib = StepsLibrary.from_snapshot(snapshot)
+
+    assert sorted(lib.steps.keys()) == ['echo2', 'wc']
+    assert lib.get_step('wc').run == urls[1]
+    assert server.downloads == ['/wc.cwl', '/wc.cwl']
@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 from scriptcwl.scriptcwl import is_url
 
 
@@ -5,3 +8,64 @@ def test_is_url():
     assert is_url('https://www.esciencecenter.nl/')
     assert is_url('http://www.esciencecenter.nl/')
     assert not is_url('file:///home/xxx/cwl-working-dir/test/cwl')
+
+
+def test_import_does_not_import_cwltool():
+    code = 'import sys, scriptcwl; ' \
+           'print([m for m in sys.modules if m.startswith("cwltool")])'
+    out = subprocess.check_output([sys.executable, '-c', code])
+
+    assert out.decode('utf-8').strip() == '[]'
+
+
+def test_import_submodules_does_not_import_cwltool():
+    code = 'import sys, pkgutil, importlib, scriptcwl; ' \
+           '[importlib.import_module("scriptcwl." + m.name) ' \
+           ' for m in pkgutil.iter_modules(scriptcwl.__path__)]; ' \
+           'scriptcwl.WorkflowGenerator(); ' \
+           'print([m for m in sys.modules if m.startswith("cwltool")])'
+    out = subprocess.check_output([sys.executable, '-c', code])
+
+    assert out.decode('utf-8').strip() == '[]'
+
+
+def import_times(module):
+    """Return the cumulative import times (in microseconds) of the modules
+    imported by ``import <module>``, as reported by ``python -X importtime``.
+    """
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                          'import {}'.format(module)],
+                         stderr=subprocess.PIPE)
+    _, err = p.communicate()
+    times = {}
+    for line in err.decode('utf-8').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            try:
+                times[name.strip()] = int(cumulative)
+            except ValueError:
+                # header
+                pass
+    return times
+
+
+def test_import_time():
+    times = import_times('scriptcwl')
+
+    assert 'scriptcwl' in times
+    assert not [m for m in times if m.startswith('cwltool')]
+    # importing scriptcwl should take less time than importing cwltool
+    cwltool_times = import_times('cwltool.load_tool')
+    assert times['scriptcwl'] < cwltool_times['cwltool.load_tool']
+
+
+def test_trusted_loading_does_not_import_cwltool():
+    code = 'import sys; from scriptcwl.library import load_steps; ' \
+           'steps = load_steps(steps_dir="tests/data/tools", trusted=True); ' \
+           'print(sorted(steps)); ' \
+           'print([m for m in sys.modules if m.startswith("cwltool")])'
+    out = subprocess.check_output([sys.executable, '-c', code])
+
+    assert out.decode('utf-8').split('\n')[:2] == [
+        "['echo', 'multiple-out-args', 'wc']", '[]']
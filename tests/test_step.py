@@ -1,7 +1,15 @@
+import copy
+import pickle
+import tracemalloc
+
 import pytest
 
 from schema_salad.validate import ValidationException
+from scriptcwl.scriptcwl import new_loading_context
+from scriptcwl import step as step_module
+from scriptcwl.library import load_steps
 from scriptcwl.step import Step
+from scriptcwl.trusted import load_cwl_trusted
 
 
 def test_filenotfound():
@@ -86,3 +94,207 @@ class TestPrintStep(object):
         step = Step('tests/data/misc/non-python-names.cwl')
         o = 'echo_out = wf.non_python_names(first_message[, optional_message])'
         assert str(step) == o
+
+
+def test_shared_loading_context():
+    loading_context = new_loading_context()
+    echo = Step('tests/data/tools/echo.cwl', loading_context=loading_context)
+    wf = Step('tests/data/workflows/echo-wc.cwl',
+              loading_context=loading_context)
+
+    assert echo.input_names == Step('tests/data/tools/echo.cwl').input_names
+    assert wf.is_workflow
+
+
+class TestCopyStep(object):
+    @pytest.fixture
+    def step(self):
+        return Step('tests/data/tools/echo.cwl')
+
+    def test_shares_document(self, step):
+        assert step.copy().command_line_tool is step.command_line_tool
+
+    def test_state_is_copied(self, step):
+        s = step.copy()
+        s.set_input('message', 'wfmessage')
+        s.scattered_inputs.append('message')
+        s.output_types['echoed'] = {'type': 'array', 'items': 'File'}
+
+        assert step.step_inputs == {}
+        assert step.scattered_inputs == []
+        assert step.output_types['echoed'] == 'File'
+
+
+class TestCompactStep(object):
+    @pytest.fixture
+    def step(self):
+        return Step('tests/data/misc/non-python-names.cwl')
+
+    def test_no_instance_dict(self, step):
+        assert not hasattr(step, '__dict__')
+
+    def test_input_table(self, step):
+        assert step.input_names == ['first-message']
+        assert step.optional_input_names == ['optional-message']
+        assert step.input_types == {'first-message': 'string'}
+        assert step.python_names == {'first_message': 'first-message',
+                                     'optional_message': 'optional-message',
+                                     'echo_out': 'echo-out'}
+
+    def test_views_are_derived_once(self, step):
+        assert step.input_types is step.input_types
+        assert step.python_names is step.python_names
+
+    def test_views_are_shared_by_copies(self, step):
+        s = step.copy()
+
+        assert s.input_names is step.input_names
+        assert s.python_names is step.python_names
+
+    def test_views_can_be_assigned(self, step):
+        step.input_types = {'first-message': 'File'}
+
+        assert step.input_names == ['first-message']
+        assert step.input_types == {'first-message': 'File'}
+
+    def test_assigning_does_not_change_copies(self, step):
+        s = step.copy()
+        s.input_types = {'first-message': 'File'}
+
+        assert step.input_types == {'first-message': 'string'}
+        assert s.command_line_tool is step.command_line_tool
+
+    def test_assigning_input_table(self, step):
+        s = step.copy()
+        s.input_table = (('message', 'string', False),)
+
+        assert s.input_names == ['message']
+        assert step.input_names == ['first-message']
+
+    def test_tool_is_shared_by_copies(self, step):
+        assert step.copy().tool is step.tool
+
+    def test_views_are_derived_on_first_use(self):
+        step = Step('tests/data/misc/non-python-names.cwl')
+        str(step)
+        pickle.loads(pickle.dumps(step.copy()))
+
+        assert not hasattr(step.tool, 'python_names')
+        assert step.python_names['echo_out'] == 'echo-out'
+        assert hasattr(step.tool, 'python_names')
+
+    def test_pickle(self, step):
+        s = pickle.loads(pickle.dumps(step))
+
+        assert s.input_table == step.input_table
+        assert s.python_names == step.python_names
+        assert s.sha256 == step.sha256
+
+    def test_memory_of_copies(self, step):
+        def allocated(make_copy):
+            tracemalloc.start()
+            try:
+                before = tracemalloc.take_snapshot()
+                copies = [make_copy(step) for _ in range(100)]
+                after = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+            assert len(copies) == 100
+            return sum(stat.size_diff
+                       for stat in after.compare_to(before, 'filename'))
+
+        # a copy shares the parsed document and the input definitions with
+        # the step in the steps library
+        assert allocated(Step.copy) * 10 < allocated(copy.deepcopy)
+
+
+class TestTrustedStep(object):
+    attributes = ('run', 'from_url', 'name', 'python_name', 'is_workflow',
+                  'input_table', 'output_types', 'output_names',
+                  'python_names', 'step_inputs', 'is_scattered',
+                  'scattered_inputs')
+
+    @pytest.mark.parametrize('cwl_file', [
+        'tests/data/tools/echo.cwl',
+        'tests/data/tools/multiple-out-args.cwl',
+        'tests/data/tools/wc.cwl',
+        'tests/data/workflows/echo-wc.cwl',
+        'tests/data/echo.scattered.cwl',
+        'tests/data/echo-wc.workflowstep.cwl',
+        'tests/data/misc/non-python-names.cwl',
+        'tests/data/misc/echo2.cwl',
+    ])
+    def test_same_attributes(self, cwl_file):
+        validated = Step(cwl_file)
+        trusted = Step(cwl_file, trusted=True)
+
+        for attr in self.attributes:
+            assert getattr(trusted, attr) == getattr(validated, attr), attr
+
+    def test_not_validated(self, monkeypatch):
+        def fail(fname, loading_context=None):
+            raise AssertionError('{} validated'.format(fname))
+
+        monkeypatch.setattr(step_module, 'load_cwl', fail)
+        s = Step('tests/data/tools/echo.cwl', trusted=True)
+
+        assert s.output_types == {'echoed': 'File'}
+
+    def test_fallback(self, tmpdir):
+        cwl_file = tmpdir.join('enum.cwl')
+        cwl_file.write('\n'.join([
+            'cwlVersion: v1.0',
+            'class: CommandLineTool',
+            'baseCommand: echo',
+            'inputs:',
+            '  color:',
+            '    type:',
+            '      type: enum',
+            '      symbols: [red, green]',
+            'outputs: []']))
+        validated = Step(cwl_file.strpath)
+        trusted = Step(cwl_file.strpath, trusted=True)
+
+        assert trusted.input_table == validated.input_table
+
+    def test_document_with_id(self, tmpdir):
+        cwl_file = tmpdir.join('mytool.cwl')
+        cwl_file.write('\n'.join([
+            'cwlVersion: v1.0',
+            'class: CommandLineTool',
+            'id: mytool',
+            'baseCommand: echo',
+            'inputs:',
+            '  message:',
+            '    type: string',
+            'outputs:',
+            '  out:',
+            '    type: stdout']))
+        validated = Step(cwl_file.strpath)
+        trusted = Step(cwl_file.strpath, trusted=True)
+
+        assert trusted.input_names == validated.input_names
+        assert trusted.output_names == validated.output_names
+        assert trusted.python_names == validated.python_names
+
+    def test_missing_file(self):
+        with pytest.raises(ValidationException):
+            Step('tests/data/tools/idontexist.cwl', trusted=True)
+
+    def test_not_utf8(self, tmpdir):
+        cwl_file = tmpdir.join('latin1.cwl')
+        cwl_file.write_binary(u'\n'.join([
+            u'# caf\xe9',
+            u'cwlVersion: v1.0',
+            u'class: CommandLineTool',
+            u'baseCommand: echo',
+            u'inputs: []',
+            u'outputs: []']).encode('latin-1'))
+
+        assert load_cwl_trusted(cwl_file.strpath) is None
+
+    def test_load_steps_missing_file(self):
+        steps = load_steps(step_list=['tests/data/tools/echo.cwl',
+                                      'nonexistent.cwl'], trusted=True)
+
+        assert list(steps.keys()) == ['echo']
@@ -0,0 +1,20 @@
+import pytest
+
+from scriptcwl.typeindex import type_keys
+
+
+@pytest.mark.parametrize('typ,expected', [
+    ('File', ['File']),
+    ('File?', ['File']),
+    ('File[]?', ['File[]']),
+    (['null', 'File'], ['File']),
+    (['File', 'Directory'], ['File', 'Directory']),
+    ({'type': 'array', 'items': 'string'}, ['string[]']),
+    ({'type': 'array', 'items': {'type': 'array', 'items': 'File'}},
+     ['File[][]']),
+    ({'type': 'enum', 'symbols': ['a', 'b']}, ['enum']),
+    ({'type': 'record', 'name': 'file:///steps/types.yml#Sample'},
+     ['Sample']),
+])
+def test_type_keys(typ, expected):
+    assert type_keys(typ) == expected
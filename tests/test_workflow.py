@@ -2,14 +2,19 @@ from __future__ import print_function
 
 import pytest
 import os
+import subprocess
+import sys
 
+from concurrent.futures import ThreadPoolExecutor
 from shutil import copytree
 from ruamel import yaml
 
 from schema_salad.validate import ValidationException
 
 from scriptcwl import WorkflowGenerator
-from scriptcwl.library import load_yaml
+from scriptcwl.library import StepsLibrary, load_yaml
+from scriptcwl.reference import Reference
+from scriptcwl.step import Step
 
 
 def setup_workflowgenerator(tmpdir):
@@ -25,6 +30,18 @@ def setup_workflowgenerator(tmpdir):
     return wf
 
 
+def setup_echo_wc_workflow():
+    """Return a workflow in which the output of echo is counted by wc."""
+    wf = WorkflowGenerator()
+    wf.load('tests/data/tools')
+
+    wfmessage = wf.add_input(wfmessage='string')
+    echoed = wf.echo(message=wfmessage)
+    wced = wf.wc(file2count=echoed)
+    wf.add_outputs(wced=wced)
+    return wf
+
+
 class TestWorkflowGenerator(object):
     def test_load(self):
         wf = WorkflowGenerator()
@@ -240,6 +257,26 @@ class TestWorkflowGenerator(object):
         print('expected:', expected)
         assert actual == expected
 
+    def test_save_with_wd_symlink(self, tmpdir):
+        wf = WorkflowGenerator(working_dir=tmpdir.join('wd').strpath,
+                               staging='symlink')
+        wf.load('tests/data/tools')
+
+        wfmessage = wf.add_input(wfmessage='string')
+        echoed = wf.echo(message=wfmessage)
+        wced = wf.wc(file2count=echoed)
+        wf.add_outputs(wfcount=wced)
+
+        wf_filename = tmpdir.join('echo-wc.cwl')
+        wf.save(wf_filename.strpath, mode='wd')
+
+        assert tmpdir.join('wd', 'echo.cwl').islink()
+        assert not wf_filename.islink()
+        assert wf_filename.read() == tmpdir.join('wd', 'echo-wc.cwl').read()
+
+        tmpdir.join('wd').remove()
+        assert 'steps' in load_yaml(wf_filename.strpath)
+
     def test_save_with_wd_no_wd(self, tmpdir):
         wf = WorkflowGenerator()
 
@@ -827,3 +864,350 @@ class TestArraysAndOtherComplexWFInputTypes(object):
 
         with pytest.raises(ValidationException):
             wf.validate()
+
+
+class TestLazyWorkflowGenerator(object):
+    def test_add_step(self):
+        wf = WorkflowGenerator(steps_dir='tests/data/tools', lazy=True)
+        assert wf.steps_library.steps == {}
+
+        msg = wf.add_input(msg='string')
+        echoed = wf.echo(message=msg)
+
+        assert str(echoed) == 'echo/echoed'
+        assert list(wf.steps_library.steps.keys()) == ['echo']
+
+
+class TestAddStepMultipleTimes(object):
+    def test_steps_are_independent(self):
+        wf = WorkflowGenerator(steps_dir='tests/data/tools')
+        msg = wf.add_input(msg='string')
+        msgs = wf.add_input(msgs='string[]')
+        echoed1 = wf.echo(message=msg)
+        echoed2 = wf.echo(message=msgs, scatter='message')
+        wf.add_outputs(out1=echoed1, out2=echoed2)
+
+        assert not wf.wf_steps['echo'].is_scattered
+        assert wf.wf_steps['echo'].step_inputs == {'message': 'msg'}
+        assert wf.wf_steps['echo-1'].is_scattered
+        assert wf.wf_outputs['out1']['type'] == 'File'
+        assert wf.steps_library.get_step('echo').step_inputs == {}
+
+    def test_no_yaml_aliases(self):
+        wf = WorkflowGenerator(steps_dir='tests/data/tools')
+        files = wf.add_input(files='File[]')
+        counselors = wf.add_input(counselors='string[]')
+        out_files1, _ = wf.multiple_out_args(in_files=files,
+                                             counselors=counselors)
+        out_files2, _ = wf.multiple_out_args(in_files=files,
+                                             counselors=counselors)
+        wf.add_outputs(out1=out_files1, out2=out_files2)
+
+        assert '&id' not in str(wf)
+
+
+class TestGenerateStepName(object):
+    def test_generated_names(self):
+        wf = WorkflowGenerator()
+        names = []
+        for step_name in ['echo', 'echo', 'echo-1', 'echo', 'wc', 'echo',
+                          'echo-1']:
+            name = wf._generate_step_name(step_name)
+            wf._step_ids.add(name)
+            names.append(name)
+
+        assert names == ['echo', 'echo-1', 'echo-1-1', 'echo-2', 'wc',
+                         'echo-3', 'echo-1-2']
+
+    def test_name_taken_by_other_step(self):
+        wf = WorkflowGenerator()
+        for step_name in ['echo', 'echo-2', 'echo']:
+            wf._step_ids.add(wf._generate_step_name(step_name))
+
+        assert wf._generate_step_name('echo') == 'echo-3'
+
+
+class TestSharedStepsLibrary(object):
+    def test_step_names_per_workflow(self):
+        wf1 = WorkflowGenerator(steps_dir='tests/data/tools')
+        wf2 = WorkflowGenerator(library=wf1.steps_library)
+
+        for wf in (wf1, wf2):
+            msg = wf.add_input(msg='string')
+            wf.echo(message=msg)
+
+        assert list(wf1.wf_steps.keys()) == ['echo']
+        assert list(wf2.wf_steps.keys()) == ['echo']
+
+    def test_concurrent_workflows(self):
+        library = WorkflowGenerator(steps_dir='tests/data/tools',
+                                    lazy=True).steps_library
+
+        def generate(i):
+            wf = WorkflowGenerator(library=library)
+            msg = wf.add_input(msg='string')
+            for _ in range(10):
+                wf.wc(file2count=wf.echo(message=msg))
+            return list(wf.wf_steps.keys())
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(generate, range(8)))
+
+        for step_names in results:
+            assert len(step_names) == 20
+            assert step_names[:4] == ['echo', 'wc', 'echo-1', 'wc-1']
+        assert sorted(library.steps.keys()) == ['echo', 'wc']
+
+    def test_frozen_library(self):
+        library = StepsLibrary()
+        library.load(steps_dir='tests/data/tools')
+        library.freeze()
+        wf = WorkflowGenerator(library=library)
+
+        assert wf.steps_library is library
+        with pytest.raises(ValueError):
+            wf.load(step_file='tests/data/misc/echo2.cwl')
+
+    def test_working_dir_from_library(self, tmpdir):
+        library = StepsLibrary(working_dir=tmpdir.strpath)
+        wf = WorkflowGenerator(library=library)
+
+        assert wf.get_working_dir() == tmpdir.strpath
+
+    def test_different_working_dir(self, tmpdir):
+        library = StepsLibrary(working_dir=tmpdir.join('lib').strpath)
+
+        with pytest.raises(ValueError):
+            WorkflowGenerator(working_dir=tmpdir.join('wf').strpath,
+                              library=library)
+
+
+class TestValidateInMemory(object):
+    def test_validate_does_not_write_tmp_file(self, monkeypatch):
+        wf = setup_echo_wc_workflow()
+
+        def mkstemp(*args, **kwargs):
+            raise AssertionError('validate should not create tmp files')
+        monkeypatch.setattr('tempfile.mkstemp', mkstemp)
+
+        wf.validate()
+
+    def test_validate_invalid_source(self):
+        wf = setup_echo_wc_workflow()
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'missing/output'
+
+        with pytest.raises(ValidationException):
+            wf.validate()
+
+    def test_save_serializes_once(self, tmpdir, monkeypatch):
+        wf = setup_echo_wc_workflow()
+
+        import scriptcwl.workflow
+        calls = []
+        save_yaml = scriptcwl.workflow.save_yaml
+
+        def counting_save_yaml(*args, **kwargs):
+            calls.append(kwargs['fname'])
+            return save_yaml(*args, **kwargs)
+        monkeypatch.setattr(scriptcwl.workflow, 'save_yaml',
+                            counting_save_yaml)
+
+        fname = tmpdir.join('workflow.cwl').strpath
+        wf.save(fname, mode='abs')
+
+        assert calls == [fname]
+
+
+class TestIncrementalValidation(object):
+    @pytest.fixture
+    def wf(self):
+        wf = setup_echo_wc_workflow()
+        wf.validate()
+        return wf
+
+    def count_cwltool_validations(self, monkeypatch):
+        import scriptcwl.workflow
+        calls = []
+        load_cwl_obj = scriptcwl.workflow.load_cwl_obj
+
+        def counting_load_cwl_obj(*args, **kwargs):
+            calls.append(args[1])
+            return load_cwl_obj(*args, **kwargs)
+        monkeypatch.setattr(scriptcwl.workflow, 'load_cwl_obj',
+                            counting_load_cwl_obj)
+        return calls
+
+    def test_added_step_is_not_validated_with_cwltool(self, wf, monkeypatch):
+        calls = self.count_cwltool_validations(monkeypatch)
+
+        echoed = wf.echo(message=Reference(input_name='wfmessage'))
+        wf.add_outputs(echoed=echoed)
+        wf.validate()
+
+        assert calls == []
+
+    def test_full_validation(self, wf, monkeypatch):
+        calls = self.count_cwltool_validations(monkeypatch)
+
+        wf.validate(full=True)
+
+        assert len(calls) == 1
+
+    def test_changed_input_is_validated_with_cwltool(self, wf, monkeypatch):
+        calls = self.count_cwltool_validations(monkeypatch)
+
+        wf.wf_inputs['wfmessage'] = {'type': 'string', 'default': 'hello'}
+        wf.validate()
+
+        assert len(calls) == 1
+
+    def test_invalid_source(self, wf):
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'missing/output'
+        with pytest.raises(ValidationException):
+            wf.validate()
+
+    def test_unconnected_required_input(self, wf):
+        del wf.wf_steps['wc'].step_inputs['file2count']
+        with pytest.raises(ValidationException):
+            wf.validate()
+
+    def test_invalid_output_source(self, wf):
+        wf.wf_outputs['wced']['outputSource'] = 'wc/missing'
+        with pytest.raises(ValidationException):
+            wf.validate()
+
+    def test_replaced_tool_is_validated_again(self, tmpdir, monkeypatch):
+        wf = WorkflowGenerator()
+        cwl = tmpdir.join('echo.cwl')
+        with open('tests/data/tools/echo.cwl') as f:
+            cwl.write(f.read())
+        wf.load(step_file=cwl.strpath)
+        wf.load(step_file='tests/data/tools/wc.cwl')
+        wfmessage = wf.add_input(wfmessage='string')
+        echoed = wf.echo(message=wfmessage)
+        wf.add_outputs(wced=wf.wc(file2count=echoed))
+        wf.validate()
+        calls = self.count_cwltool_validations(monkeypatch)
+
+        # replace the tool of the echo step by a tool from the same file,
+        # with another output
+        cwl.write(cwl.read().replace('echoed', 'printed'))
+        step = Step(cwl.strpath).copy()
+        step.step_inputs = wf.wf_steps['echo'].step_inputs
+        step._set_name_in_workflow('echo')
+        wf.wf_steps['echo'] = step
+
+        with pytest.raises(ValidationException):
+            wf.validate()
+        assert len(calls) == 1
+
+    def test_invalid_workflow_is_validated_again(self, wf, monkeypatch):
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'missing/output'
+        with pytest.raises(ValidationException):
+            wf.validate(full=True)
+        calls = self.count_cwltool_validations(monkeypatch)
+
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'echo/echoed'
+        wf.validate()
+
+        assert len(calls) == 1
+
+
+class TestFastValidation(object):
+    def test_valid_workflow(self):
+        wf = setup_echo_wc_workflow()
+
+        wf.validate(fast=True)
+
+    def test_does_not_import_cwltool(self):
+        code = 'import sys; from scriptcwl import WorkflowGenerator; ' \
+               'wf = WorkflowGenerator(trusted=True); ' \
+               'wf.load("tests/data/tools"); ' \
+               'msg = wf.add_input(msg="string"); ' \
+               'wced = wf.wc(file2count=wf.echo(message=msg)); ' \
+               'wf.add_outputs(wced=wced); ' \
+               'wf.validate(fast=True); ' \
+               'print([m for m in sys.modules if m.startswith("cwltool")])'
+        out = subprocess.check_output([sys.executable, '-c', code])
+
+        assert out.decode('utf-8').strip() == '[]'
+
+    def test_invalid_source(self):
+        wf = setup_echo_wc_workflow()
+
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'missing/output'
+        with pytest.raises(ValidationException):
+            wf.validate(fast=True)
+
+    def test_missing_workflow_input(self):
+        wf = setup_echo_wc_workflow()
+
+        wf.wf_steps['echo'].step_inputs['message'] = 'missing'
+        with pytest.raises(ValidationException):
+            wf.validate(fast=True)
+
+    def test_cycle(self):
+        wf = WorkflowGenerator()
+        wf.load('tests/data/tools')
+        txt = wf.add_input(txt='File')
+        wced = wf.wc(file2count=txt)
+        wf.wc(file2count=wced)
+
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'wc-1/wced'
+        with pytest.raises(ValidationException) as excinfo:
+            wf.validate(fast=True)
+        assert 'cycle' in str(excinfo.value)
+
+    def test_invalid_output_source(self):
+        wf = setup_echo_wc_workflow()
+
+        wf.wf_outputs['wced']['outputSource'] = 'wc/missing'
+        with pytest.raises(ValidationException):
+            wf.validate(fast=True)
+
+    def test_invalid_scatter_variable(self):
+        wf = setup_echo_wc_workflow()
+
+        wf.wf_steps['echo'].scattered_inputs.append('missing')
+        wf.has_scatter_requirement = True
+        with pytest.raises(ValidationException):
+            wf.validate(fast=True)
+
+    def test_missing_requirement(self):
+        wf = WorkflowGenerator()
+        wf.load('tests/data/tools')
+        msgs = wf.add_input(wfmessages='string[]')
+        wf.echo(message=msgs, scatter='message')
+
+        wf.has_scatter_requirement = False
+        with pytest.raises(ValidationException):
+            wf.validate(fast=True)
+
+    def test_full_and_fast(self):
+        wf = setup_echo_wc_workflow()
+
+        with pytest.raises(ValueError):
+            wf.validate(full=True, fast=True)
+
+    def test_save_fast(self, tmpdir, monkeypatch):
+        wf = setup_echo_wc_workflow()
+
+        import scriptcwl.workflow
+
+        def load_cwl_obj(*args, **kwargs):
+            raise AssertionError('cwltool should not be used')
+        monkeypatch.setattr(scriptcwl.workflow, 'load_cwl_obj', load_cwl_obj)
+
+        fname = tmpdir.join('workflow.cwl').strpath
+        wf.save(fname, mode='abs', validate='fast')
+
+        assert os.path.exists(fname)
+
+    def test_save_fast_invalid(self, tmpdir):
+        wf = setup_echo_wc_workflow()
+        wf.wf_steps['wc'].step_inputs['file2count'] = 'missing/output'
+
+        fname = tmpdir.join('workflow.cwl').strpath
+        with pytest.raises(ValidationException):
+            wf.save(fname, mode='abs', validate='fast')
+        assert not os.path.exists(fname)
@@ -1,8 +1,14 @@
-from scriptcwl.yamlutils import is_multiline
+import pytest
+
+from scriptcwl import yamlutils
+from scriptcwl.yamlutils import is_multiline, yaml2string, dump
 from scriptcwl import WorkflowGenerator
 
+import json
 import os
 
+from ruamel import yaml
+
 
 def test_is_multiline():
     assert not is_multiline('single line string')
@@ -17,3 +23,84 @@ def test_multiline_output(tmpdir):
     with open(tmpfile) as f:
         contents = f.readlines()
         assert len(contents) > 7
+
+
+@pytest.fixture
+def wf():
+    wf = WorkflowGenerator()
+    wf.load(step_list=['tests/data/tools', 'tests/data/workflows/echo-wc.cwl'])
+    wf.set_documentation('Testing a multiline\ndocumentation string')
+    wf.set_label('Émitter test')
+
+    msg = wf.add_input(wfmessage='string', default='hello')
+    msgs = wf.add_input(wfmessages='string[]')
+    echoed = wf.echo(message=msg)
+    wced = wf.wc(file2count=echoed)
+    scattered = wf.echo(message=msgs, scatter='message')
+    counted = wf.echo_wc(wfmessage=msg)
+    wf.add_outputs(wfcount=wced, echoed=scattered, counted=counted)
+    return wf
+
+
+@pytest.mark.parametrize('emitter', ['fast', 'json'])
+def test_emitters_same_document(wf, emitter):
+    expected = load_document(yaml2string(wf, pack=False, relpath=None,
+                                         wd=False))
+    actual = yaml2string(wf, pack=False, relpath=None, wd=False,
+                         emitter=emitter)
+
+    assert load_document(actual) == expected
+
+
+def test_fast_emitter_block_style(wf):
+    actual = yaml2string(wf, pack=False, relpath=None, wd=False,
+                         emitter='fast')
+
+    assert actual.startswith('#!/usr/bin/env cwl-runner\ncwlVersion: v1.0\n')
+    assert 'doc: |-\n  Testing a multiline\n' in actual
+    assert 'label: Émitter test' in actual
+
+
+def test_json_emitter(wf, tmpdir):
+    tmpfile = tmpdir.join('test.cwl.json').strpath
+    wf.save(tmpfile, mode='abs', emitter='json')
+    with open(tmpfile) as f:
+        obj = json.load(f)
+
+    assert obj['steps']['wc']['in'] == {'file2count': 'echo/echoed'}
+
+
+def test_illegal_emitter(wf, tmpdir):
+    with pytest.raises(ValueError):
+        wf.save(tmpdir.join('test.cwl').strpath, mode='abs', emitter='xml')
+
+
+def load_document(s):
+    return yaml.YAML(typ='safe', pure=True).load(s)
+
+
+def whole_document(wf, emitter):
+    # serialize the complete document at once
+    obj = wf.to_obj(pack=False, relpath=None, wd=False)
+    if emitter == 'json':
+        return dump(obj, emitter)
+    return u'\n'.join([u'#!/usr/bin/env cwl-runner', dump(obj, emitter)])
+
+
+@pytest.mark.parametrize('emitter', ['roundtrip', 'fast', 'json'])
+@pytest.mark.parametrize('chunk_size', [1, 2, 100])
+def test_write_workflow_in_chunks(wf, emitter, chunk_size, monkeypatch):
+    monkeypatch.setattr(yamlutils, 'STEPS_PER_CHUNK', chunk_size)
+    actual = yaml2string(wf, pack=False, relpath=None, wd=False,
+                         emitter=emitter)
+
+    assert actual == whole_document(wf, emitter)
+
+
+@pytest.mark.parametrize('emitter', ['roundtrip', 'fast', 'json'])
+def test_write_workflow_without_steps(emitter):
+    wf = WorkflowGenerator()
+    actual = yaml2string(wf, pack=False, relpath=None, wd=False,
+                         emitter=emitter)
+
+    assert actual == whole_document(wf, emitter)